@@ -3,11 +3,143 @@ Database Manager - SQLite operations for local data storage.
 """
 
 import sqlite3
+import hashlib
 import json
 import os
-from datetime import datetime
+import threading
+import time
+import weakref
+import zlib
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 from pathlib import Path
 
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# Hot-path statements, kept as constants so every call hits the statement cache
+_SQL_INSERT_LOG = '''
+    INSERT OR IGNORE INTO attendance_logs (device_id, user_id, timestamp, punch_type, dedup_hash)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+# RETURNING needs SQLite 3.35+, which not every supported Python bundles
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+_SQL_INSERT_LOG_RETURNING = '''
+    INSERT INTO attendance_logs (device_id, user_id, timestamp, punch_type, dedup_hash)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT DO NOTHING
+    RETURNING id
+'''
+
+_SQL_MARK_SYNCED = '''
+    UPDATE attendance_logs
+    SET synced = 1, synced_at = ?, erpnext_response = ?
+    WHERE id = ?
+'''
+
+# Attendance logs (local cache); timestamps are epoch seconds of the device's wall clock
+_SQL_ATTENDANCE_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        device_id INTEGER,
+        user_id TEXT NOT NULL,
+        timestamp INTEGER NOT NULL,
+        punch_type INTEGER DEFAULT 0,
+        synced INTEGER DEFAULT 0,
+        synced_at DATETIME,
+        erpnext_response BLOB,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        dedup_hash INTEGER NOT NULL UNIQUE,
+        FOREIGN KEY (device_id) REFERENCES devices(id)
+    )
+'''
+
+# Attendance log columns for internal iterators, with the timestamp formatted by SQLite
+_SQL_LOG_COLUMNS = '''
+    id, device_id, user_id, datetime(timestamp, 'unixepoch') AS timestamp,
+    punch_type, synced, synced_at
+'''
+
+_SCHEMA_VERSION = 3
+
+# Trigram full-text index over user_id so substring search avoids a table scan.
+# Only inserts and deletes are mirrored; user_id is never updated.
+_SQL_ATTENDANCE_FTS = '''
+    CREATE VIRTUAL TABLE attendance_fts USING fts5(
+        user_id, content='attendance_logs', content_rowid='id', tokenize='trigram'
+    );
+    CREATE TRIGGER IF NOT EXISTS attendance_fts_insert AFTER INSERT ON attendance_logs BEGIN
+        INSERT INTO attendance_fts(rowid, user_id) VALUES (new.id, new.user_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS attendance_fts_delete AFTER DELETE ON attendance_logs BEGIN
+        INSERT INTO attendance_fts(attendance_fts, rowid, user_id) VALUES ('delete', old.id, old.user_id);
+    END;
+    INSERT INTO attendance_fts(attendance_fts) VALUES ('rebuild');
+'''
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Upper bound on how long a cached attendance log total is trusted
+_COUNT_CACHE_TTL = 30
+
+# Seconds between background WAL checkpoints
+_CHECKPOINT_INTERVAL = 60
+# Seconds between PRAGMA optimize runs. The Electron app kills the backend rather than
+# closing stdin, so close() cannot be relied on to refresh planner statistics
+_OPTIMIZE_INTERVAL = 3600
+
+
+def _to_epoch(value):
+    """Convert a naive timestamp (ISO string or datetime) to epoch seconds."""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    # Naive wall-clock time is treated as UTC, matching SQLite's strftime('%s')
+    return int((value - _EPOCH).total_seconds())
+
+
+def _dedup_hash(device_id, user_id, timestamp):
+    """Get a stable signed 64-bit key identifying a (device, user, epoch timestamp) punch."""
+    # hash() is salted per process, so derive the key from a fixed digest instead
+    digest = hashlib.blake2b(f'{device_id}\x1f{user_id}\x1f{timestamp}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def _dump_response(response):
+    """Serialize an ERPNext response to compressed JSON for the erpnext_response column."""
+    if not response:
+        return None
+    if HAS_ORJSON:
+        return zlib.compress(orjson.dumps(response))
+    return zlib.compress(json.dumps(response).encode())
+
+
+def _load_response(value):
+    """Get the JSON text of a stored erpnext_response."""
+    if value is None:
+        return None
+    return zlib.decompress(value).decode()
+
+
+def _compress_text(value):
+    """Compress a JSON text erpnext_response left by schema version 2 and older."""
+    return zlib.compress(value.encode())
+
+
+class _Connection(sqlite3.Connection):
+    """sqlite3.Connection that can be weakly referenced, so open readers can be tracked."""
+
+
+def _from_epoch(seconds):
+    """Convert epoch seconds back to a 'YYYY-MM-DD HH:MM:SS' string."""
+    return (_EPOCH + timedelta(seconds=seconds)).isoformat(sep=' ')
+
 
 class DatabaseManager:
     def __init__(self, db_path=None):
@@ -18,338 +150,630 @@ class DatabaseManager:
             db_path = app_data / 'database.sqlite'
 
         self.db_path = str(db_path)
+        # One writer connection shared by all threads, one reader per thread
         self.conn = None
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        # Every thread's open reader, so close() can reach them all; a reader is
+        # dropped from here when its thread exits
+        self._readers = weakref.WeakSet()
+        self._readers_lock = threading.Lock()
+
+        # Filtered totals for get_attendance_logs, invalidated by any write
+        self._write_generation = 0
+        self._count_cache = {}
+
+        # Parsed config values by key, dropped by save_config
+        self._config_cache = {}
+
+        # Set by initialize() when this SQLite build has FTS5 with the trigram tokenizer
+        self._has_fts = False
+
+        self._checkpoint_stop = threading.Event()
+        self._checkpoint_thread = None
+
+    def _connect(self, read_only=False):
+        """Open a new connection to the database."""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256, factory=_Connection)
+        conn.row_factory = sqlite3.Row
+        self._apply_pragmas(conn)
+        if read_only:
+            conn.execute('PRAGMA query_only=ON')
+        return conn
 
     def get_connection(self):
-        """Get database connection."""
+        """Get the shared writer connection."""
         if self.conn is None:
-            self.conn = sqlite3.connect(self.db_path)
-            self.conn.row_factory = sqlite3.Row
+            self.conn = self._connect()
         return self.conn
 
+    def get_reader(self):
+        """Get the read-only connection for the calling thread."""
+        if self.db_path == ':memory:':
+            # Every connection to :memory: is a separate database
+            return self.get_connection()
+
+        conn = getattr(self._local, 'conn', None)
+        # A reader no longer registered was closed by close()
+        if conn is None or conn not in self._readers:
+            conn = self._connect(read_only=True)
+            with self._readers_lock:
+                self._readers.add(conn)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _writer(self):
+        """Serialize use of the writer connection; commit on success, roll back on error."""
+        with self._write_lock:
+            conn = self.get_connection()
+            with conn:
+                yield conn.cursor()
+            self._write_generation += 1
+
+    def _apply_pragmas(self, conn):
+        """Tune a freshly opened connection for concurrent reads and cheap commits."""
+        # WAL is meaningless for in-memory databases
+        if self.db_path != ':memory:':
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Checkpoint rarely inline (10000 pages ~ 40MB); the background thread does it sooner
+            conn.execute('PRAGMA wal_autocheckpoint=10000')
+            conn.execute('PRAGMA journal_size_limit=67108864')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-64000')
+        conn.execute('PRAGMA mmap_size=268435456')
+        conn.execute('PRAGMA busy_timeout=30000')
+
     def initialize(self):
         """Initialize database schema."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        # Create tables
-        cursor.executescript('''
-            -- Devices table
-            CREATE TABLE IF NOT EXISTS devices (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                ip TEXT NOT NULL,
-                port INTEGER DEFAULT 4370,
-                punch_direction TEXT,
-                latitude REAL,
-                longitude REAL,
-                enabled INTEGER DEFAULT 1,
-                status TEXT DEFAULT 'offline',
-                last_sync DATETIME,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            );
-
-            -- Attendance logs (local cache)
-            CREATE TABLE IF NOT EXISTS attendance_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                device_id INTEGER,
-                user_id TEXT NOT NULL,
-                timestamp DATETIME NOT NULL,
-                punch_type INTEGER DEFAULT 0,
-                synced INTEGER DEFAULT 0,
-                synced_at DATETIME,
-                erpnext_response TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (device_id) REFERENCES devices(id),
-                UNIQUE(device_id, user_id, timestamp)
-            );
-
-            -- Sync history
-            CREATE TABLE IF NOT EXISTS sync_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                device_id INTEGER,
-                started_at DATETIME NOT NULL,
-                completed_at DATETIME,
-                records_fetched INTEGER DEFAULT 0,
-                records_synced INTEGER DEFAULT 0,
-                records_failed INTEGER DEFAULT 0,
-                status TEXT DEFAULT 'running',
-                error_message TEXT,
-                FOREIGN KEY (device_id) REFERENCES devices(id)
-            );
-
-            -- Configuration
-            CREATE TABLE IF NOT EXISTS config (
-                key TEXT PRIMARY KEY,
-                value TEXT
-            );
-
-            -- Shifts
-            CREATE TABLE IF NOT EXISTS shifts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                start_time TEXT,
-                end_time TEXT,
-                erpnext_shift_type TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            );
-
-            -- Device-Shift mapping
-            CREATE TABLE IF NOT EXISTS device_shifts (
-                device_id INTEGER,
-                shift_id INTEGER,
-                PRIMARY KEY (device_id, shift_id),
-                FOREIGN KEY (device_id) REFERENCES devices(id),
-                FOREIGN KEY (shift_id) REFERENCES shifts(id)
-            );
-
-            -- Create indexes
-            CREATE INDEX IF NOT EXISTS idx_attendance_device ON attendance_logs(device_id);
-            CREATE INDEX IF NOT EXISTS idx_attendance_timestamp ON attendance_logs(timestamp);
-            CREATE INDEX IF NOT EXISTS idx_attendance_synced ON attendance_logs(synced);
-            CREATE INDEX IF NOT EXISTS idx_sync_history_device ON sync_history(device_id);
-        ''')
+        with self._writer() as cursor:
+            # Create tables
+            cursor.executescript('''
+                -- Devices table
+                CREATE TABLE IF NOT EXISTS devices (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    ip TEXT NOT NULL,
+                    port INTEGER DEFAULT 4370,
+                    punch_direction TEXT,
+                    latitude REAL,
+                    longitude REAL,
+                    enabled INTEGER DEFAULT 1,
+                    status TEXT DEFAULT 'offline',
+                    last_sync DATETIME,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                );
+
+                -- Sync history
+                CREATE TABLE IF NOT EXISTS sync_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    device_id INTEGER,
+                    started_at DATETIME NOT NULL,
+                    completed_at DATETIME,
+                    records_fetched INTEGER DEFAULT 0,
+                    records_synced INTEGER DEFAULT 0,
+                    records_failed INTEGER DEFAULT 0,
+                    status TEXT DEFAULT 'running',
+                    error_message TEXT,
+                    FOREIGN KEY (device_id) REFERENCES devices(id)
+                );
+
+                -- Configuration
+                CREATE TABLE IF NOT EXISTS config (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+
+                -- Shifts
+                CREATE TABLE IF NOT EXISTS shifts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    start_time TEXT,
+                    end_time TEXT,
+                    erpnext_shift_type TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                );
+
+                -- Device-Shift mapping
+                CREATE TABLE IF NOT EXISTS device_shifts (
+                    device_id INTEGER,
+                    shift_id INTEGER,
+                    PRIMARY KEY (device_id, shift_id),
+                    FOREIGN KEY (device_id) REFERENCES devices(id),
+                    FOREIGN KEY (shift_id) REFERENCES shifts(id)
+                );
+            ''')
+            cursor.execute(_SQL_ATTENDANCE_TABLE.format(name='attendance_logs'))
+
+            self._migrate(cursor)
+            self._create_search_index(cursor)
+
+            cursor.executescript('''
+                -- Create indexes
+                DROP INDEX IF EXISTS idx_attendance_device;
+                CREATE INDEX IF NOT EXISTS idx_attendance_device_time ON attendance_logs(device_id, timestamp);
+                CREATE INDEX IF NOT EXISTS idx_attendance_timestamp ON attendance_logs(timestamp);
+                CREATE INDEX IF NOT EXISTS idx_attendance_user ON attendance_logs(user_id, timestamp);
+                DROP INDEX IF EXISTS idx_attendance_synced;
+                CREATE INDEX IF NOT EXISTS idx_attendance_pending ON attendance_logs(device_id, timestamp) WHERE synced = 0;
+                CREATE INDEX IF NOT EXISTS idx_attendance_synced_at ON attendance_logs(synced_at) WHERE synced = 1;
+                CREATE INDEX IF NOT EXISTS idx_sync_history_device ON sync_history(device_id);
+            ''')
+
+            # Give the query planner statistics once; close() keeps them fresh
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                cursor.execute('ANALYZE')
+
+        if self.db_path != ':memory:' and self._checkpoint_thread is None:
+            self._checkpoint_stop.clear()
+            self._checkpoint_thread = threading.Thread(target=self._checkpoint_loop, daemon=True)
+            self._checkpoint_thread.start()
 
-        conn.commit()
         return {'status': 'initialized'}
 
-    def _row_to_dict(self, row):
-        """Convert sqlite3.Row to dictionary."""
-        if row is None:
-            return None
-        return dict(row)
+    def _checkpoint_loop(self):
+        """
+        Periodically copy the WAL back into the database while no write is in progress,
+        refreshing planner statistics every _OPTIMIZE_INTERVAL.
+        """
+        last_optimize = time.monotonic()
+        while not self._checkpoint_stop.wait(_CHECKPOINT_INTERVAL):
+            # Skip this round rather than make a writer wait behind the checkpoint
+            if not self._write_lock.acquire(blocking=False):
+                continue
+            try:
+                if self.conn is not None:
+                    self.conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+                    if time.monotonic() - last_optimize >= _OPTIMIZE_INTERVAL:
+                        last_optimize = time.monotonic()
+                        self.conn.execute('PRAGMA optimize')
+            except sqlite3.Error:
+                pass
+            finally:
+                self._write_lock.release()
+
+    def close(self):
+        """Refresh planner statistics and close this manager's connections."""
+        if self._checkpoint_thread is not None:
+            self._checkpoint_stop.set()
+            self._checkpoint_thread.join()
+            self._checkpoint_thread = None
+
+        # Close every thread's reader, not just this one's; open readers hold WAL
+        # read marks that would keep the final checkpoint from completing
+        with self._readers_lock:
+            readers = list(self._readers)
+            self._readers.clear()
+        for reader in readers:
+            reader.close()
+        self._local.conn = None
+
+        with self._write_lock:
+            if self.conn is not None:
+                self.conn.execute('PRAGMA optimize')
+                self.conn.close()
+                self.conn = None
+
+    def maintenance(self):
+        """Truncate the WAL and reclaim free pages. Meant for an occasional scheduled run."""
+        with self._write_lock:
+            conn = self.get_connection()
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            conn.execute('VACUUM')
+        return {'status': 'ok'}
+
+    def _migrate(self, cursor):
+        """Upgrade a database created by an older version to the current schema."""
+        cursor.execute('PRAGMA user_version')
+        version = cursor.fetchone()[0]
+
+        if version < 2:
+            # v1: attendance timestamps moved from ISO text to INTEGER epoch seconds
+            # v2: UNIQUE(device_id, user_id, timestamp) replaced by a dedup_hash key
+            cursor.execute('PRAGMA table_info(attendance_logs)')
+            columns = {row['name'] for row in cursor.fetchall()}
+            if 'dedup_hash' not in columns:
+                cursor.connection.create_function('dedup_hash', 3, _dedup_hash, deterministic=True)
+                cursor.executescript('''
+                    BEGIN;
+                    {create};
+                    INSERT OR IGNORE INTO attendance_logs_new
+                        (id, device_id, user_id, timestamp, punch_type, synced,
+                         synced_at, erpnext_response, created_at, dedup_hash)
+                    SELECT id, device_id, user_id, ts, punch_type, synced,
+                           synced_at, erpnext_response, created_at, dedup_hash(device_id, user_id, ts)
+                    FROM (
+                        SELECT *, CASE WHEN typeof(timestamp) = 'integer' THEN timestamp
+                                       ELSE CAST(strftime('%s', timestamp) AS INTEGER) END AS ts
+                        FROM attendance_logs
+                    );
+                    DROP TABLE attendance_logs;
+                    ALTER TABLE attendance_logs_new RENAME TO attendance_logs;
+                    COMMIT;
+                '''.format(create=_SQL_ATTENDANCE_TABLE.format(name='attendance_logs_new')))
+
+        if version < 3:
+            # v3: erpnext_response holds zlib-compressed JSON bytes instead of text
+            cursor.connection.create_function('compress_text', 1, _compress_text, deterministic=True)
+            cursor.execute('''
+                UPDATE attendance_logs SET erpnext_response = compress_text(erpnext_response)
+                WHERE typeof(erpnext_response) = 'text'
+            ''')
+
+        cursor.execute(f'PRAGMA user_version = {_SCHEMA_VERSION}')
+
+    def _create_search_index(self, cursor):
+        """Create the full-text index on attendance user IDs if SQLite supports it."""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'attendance_fts'")
+        if cursor.fetchone() is None:
+            try:
+                cursor.executescript(_SQL_ATTENDANCE_FTS)
+            except sqlite3.OperationalError:
+                # No FTS5, or older than 3.34 without the trigram tokenizer; search uses LIKE
+                self._has_fts = False
+                return
+        self._has_fts = True
+
+    def _day_start(self, day, offset_days=0):
+        """Get epoch seconds at midnight of a date string, optionally shifted by whole days."""
+        start = datetime.fromisoformat(day).date() + timedelta(days=offset_days)
+        return _to_epoch(datetime.combine(start, datetime.min.time()))
+
+    def _logs_to_list(self, rows):
+        """Convert attendance rows to dictionaries with ISO timestamps."""
+        logs = self._rows_to_list(rows)
+        for log in logs:
+            log['timestamp'] = _from_epoch(log['timestamp'])
+            # Only the returned rows are decompressed, never the rows a query scans
+            log['erpnext_response'] = _load_response(log['erpnext_response'])
+            # Internal key; also too wide for JavaScript numbers
+            log.pop('dedup_hash', None)
+        return logs
 
     def _rows_to_list(self, rows):
         """Convert list of sqlite3.Row to list of dictionaries."""
-        return [self._row_to_dict(row) for row in rows]
+        return list(map(dict, rows))
 
     # Device operations
     def get_devices(self):
         """Get all devices."""
-        cursor = self.get_connection().cursor()
+        cursor = self.get_reader().cursor()
         cursor.execute('SELECT * FROM devices ORDER BY created_at DESC')
         return self._rows_to_list(cursor.fetchall())
 
     def add_device(self, data):
         """Add a new device."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO devices (name, ip, port, punch_direction, latitude, longitude, enabled)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['name'],
-            data['ip'],
-            data.get('port', 4370),
-            data.get('punch_direction'),
-            data.get('latitude'),
-            data.get('longitude'),
-            1 if data.get('enabled', True) else 0
-        ))
-        conn.commit()
+        with self._writer() as cursor:
+            cursor.execute('''
+                INSERT INTO devices (name, ip, port, punch_direction, latitude, longitude, enabled)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                data['name'],
+                data['ip'],
+                data.get('port', 4370),
+                data.get('punch_direction'),
+                data.get('latitude'),
+                data.get('longitude'),
+                1 if data.get('enabled', True) else 0
+            ))
         return {'id': cursor.lastrowid}
 
     def update_device(self, data):
         """Update an existing device."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE devices
-            SET name = ?, ip = ?, port = ?, punch_direction = ?,
-                latitude = ?, longitude = ?, enabled = ?
-            WHERE id = ?
-        ''', (
-            data['name'],
-            data['ip'],
-            data.get('port', 4370),
-            data.get('punch_direction'),
-            data.get('latitude'),
-            data.get('longitude'),
-            1 if data.get('enabled', True) else 0,
-            data['id']
-        ))
-        conn.commit()
+        with self._writer() as cursor:
+            cursor.execute('''
+                UPDATE devices
+                SET name = ?, ip = ?, port = ?, punch_direction = ?,
+                    latitude = ?, longitude = ?, enabled = ?
+                WHERE id = ?
+            ''', (
+                data['name'],
+                data['ip'],
+                data.get('port', 4370),
+                data.get('punch_direction'),
+                data.get('latitude'),
+                data.get('longitude'),
+                1 if data.get('enabled', True) else 0,
+                data['id']
+            ))
         return {'updated': cursor.rowcount}
 
     def delete_device(self, device_id):
         """Delete a device."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM devices WHERE id = ?', (device_id,))
-        conn.commit()
+        with self._writer() as cursor:
+            cursor.execute('DELETE FROM devices WHERE id = ?', (device_id,))
         return {'deleted': cursor.rowcount}
 
     def update_device_status(self, device_id, status, last_sync=None):
         """Update device status and last sync time."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        if last_sync:
-            cursor.execute(
-                'UPDATE devices SET status = ?, last_sync = ? WHERE id = ?',
-                (status, last_sync, device_id)
-            )
-        else:
-            cursor.execute(
-                'UPDATE devices SET status = ? WHERE id = ?',
-                (status, device_id)
-            )
-        conn.commit()
+        with self._writer() as cursor:
+            if last_sync:
+                cursor.execute(
+                    'UPDATE devices SET status = ?, last_sync = ? WHERE id = ?',
+                    (status, last_sync, device_id)
+                )
+            else:
+                cursor.execute(
+                    'UPDATE devices SET status = ? WHERE id = ?',
+                    (status, device_id)
+                )
 
     # Shift operations
     def get_shifts(self):
         """Get all shifts with device mappings."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM shifts ORDER BY created_at DESC')
+        cursor = self.get_reader().cursor()
+        cursor.execute('''
+            SELECT s.*, GROUP_CONCAT(ds.device_id) AS device_ids
+            FROM shifts s
+            LEFT JOIN device_shifts ds ON ds.shift_id = s.id
+            GROUP BY s.id
+            ORDER BY s.created_at DESC
+        ''')
         shifts = self._rows_to_list(cursor.fetchall())
 
-        # Get device mappings for each shift
+        # Device mappings arrive as a comma separated list
         for shift in shifts:
-            cursor.execute(
-                'SELECT device_id FROM device_shifts WHERE shift_id = ?',
-                (shift['id'],)
-            )
-            shift['device_ids'] = [row['device_id'] for row in cursor.fetchall()]
+            shift['device_ids'] = [int(x) for x in (shift['device_ids'] or '').split(',') if x]
 
         return shifts
 
     def add_shift(self, data):
         """Add a new shift."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO shifts (name, start_time, end_time, erpnext_shift_type)
-            VALUES (?, ?, ?, ?)
-        ''', (
-            data['name'],
-            data.get('start_time'),
-            data.get('end_time'),
-            data.get('erpnext_shift_type')
-        ))
-        shift_id = cursor.lastrowid
-
-        # Add device mappings
-        device_ids = data.get('device_ids', [])
-        for device_id in device_ids:
-            cursor.execute(
-                'INSERT OR IGNORE INTO device_shifts (device_id, shift_id) VALUES (?, ?)',
-                (device_id, shift_id)
-            )
+        with self._writer() as cursor:
+            cursor.execute('''
+                INSERT INTO shifts (name, start_time, end_time, erpnext_shift_type)
+                VALUES (?, ?, ?, ?)
+            ''', (
+                data['name'],
+                data.get('start_time'),
+                data.get('end_time'),
+                data.get('erpnext_shift_type')
+            ))
+            shift_id = cursor.lastrowid
+
+            # Add device mappings
+            device_ids = data.get('device_ids', [])
+            for device_id in device_ids:
+                cursor.execute(
+                    'INSERT OR IGNORE INTO device_shifts (device_id, shift_id) VALUES (?, ?)',
+                    (device_id, shift_id)
+                )
 
-        conn.commit()
         return {'id': shift_id}
 
     def update_shift(self, data):
         """Update an existing shift."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE shifts
-            SET name = ?, start_time = ?, end_time = ?, erpnext_shift_type = ?
-            WHERE id = ?
-        ''', (
-            data['name'],
-            data.get('start_time'),
-            data.get('end_time'),
-            data.get('erpnext_shift_type'),
-            data['id']
-        ))
-
-        # Update device mappings
-        cursor.execute('DELETE FROM device_shifts WHERE shift_id = ?', (data['id'],))
-        device_ids = data.get('device_ids', [])
-        for device_id in device_ids:
-            cursor.execute(
-                'INSERT INTO device_shifts (device_id, shift_id) VALUES (?, ?)',
-                (device_id, data['id'])
-            )
+        with self._writer() as cursor:
+            cursor.execute('''
+                UPDATE shifts
+                SET name = ?, start_time = ?, end_time = ?, erpnext_shift_type = ?
+                WHERE id = ?
+            ''', (
+                data['name'],
+                data.get('start_time'),
+                data.get('end_time'),
+                data.get('erpnext_shift_type'),
+                data['id']
+            ))
+
+            # Update device mappings
+            cursor.execute('DELETE FROM device_shifts WHERE shift_id = ?', (data['id'],))
+            device_ids = data.get('device_ids', [])
+            for device_id in device_ids:
+                cursor.execute(
+                    'INSERT INTO device_shifts (device_id, shift_id) VALUES (?, ?)',
+                    (device_id, data['id'])
+                )
 
-        conn.commit()
         return {'updated': cursor.rowcount}
 
     def delete_shift(self, shift_id):
         """Delete a shift."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM device_shifts WHERE shift_id = ?', (shift_id,))
-        cursor.execute('DELETE FROM shifts WHERE id = ?', (shift_id,))
-        conn.commit()
+        with self._writer() as cursor:
+            cursor.execute('DELETE FROM device_shifts WHERE shift_id = ?', (shift_id,))
+            cursor.execute('DELETE FROM shifts WHERE id = ?', (shift_id,))
         return {'deleted': cursor.rowcount}
 
     # Attendance log operations
     def add_attendance_log(self, device_id, user_id, timestamp, punch_type=0):
-        """Add an attendance log entry."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('''
-                INSERT OR IGNORE INTO attendance_logs (device_id, user_id, timestamp, punch_type)
-                VALUES (?, ?, ?, ?)
-            ''', (device_id, user_id, timestamp, punch_type))
-            conn.commit()
-            return cursor.lastrowid
-        except sqlite3.IntegrityError:
-            return None  # Duplicate entry
+        """Add an attendance log entry. Returns the new id, or None for a duplicate."""
+        ts = _to_epoch(timestamp)
+        params = (device_id, user_id, ts, punch_type, _dedup_hash(device_id, user_id, ts))
+
+        with self._writer() as cursor:
+            if _HAS_RETURNING:
+                cursor.execute(_SQL_INSERT_LOG_RETURNING, params)
+                row = cursor.fetchone()
+                return row[0] if row else None
+
+            # lastrowid is stale when the insert was ignored, so check rowcount first
+            cursor.execute(_SQL_INSERT_LOG, params)
+            return cursor.lastrowid if cursor.rowcount == 1 else None
+
+    def add_attendance_logs_bulk(self, rows):
+        """
+        Add many attendance log entries in a single transaction.
+
+        Args:
+            rows: iterable of (device_id, user_id, timestamp, punch_type) tuples
+
+        Returns:
+            list of sqlite3.Row for the newly inserted logs (duplicates are skipped)
+        """
+        # Convert and hash before taking the writer lock
+        params = []
+        for device_id, user_id, timestamp, punch_type in rows:
+            ts = _to_epoch(timestamp)
+            params.append((device_id, user_id, ts, punch_type, _dedup_hash(device_id, user_id, ts)))
+        if not params:
+            return []
+
+        with self._writer() as cursor:
+            # Ids are AUTOINCREMENT, so anything above the current max is new
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM attendance_logs')
+            last_id = cursor.fetchone()[0]
+
+            cursor.executemany(_SQL_INSERT_LOG, params)
+
+            cursor.execute(
+                f'SELECT {_SQL_LOG_COLUMNS} FROM attendance_logs WHERE id > ? ORDER BY id',
+                (last_id,)
+            )
+            return cursor.fetchall()
 
     def update_attendance_synced(self, log_id, response=None):
         """Mark attendance log as synced."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE attendance_logs
-            SET synced = 1, synced_at = ?, erpnext_response = ?
-            WHERE id = ?
-        ''', (datetime.now().isoformat(), json.dumps(response) if response else None, log_id))
-        conn.commit()
-
-    def get_attendance_logs(self, page=1, limit=20, search=None, status=None,
-                            device_id=None, date_from=None, date_to=None):
-        """Get attendance logs with filters."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self._writer() as cursor:
+            cursor.execute(
+                _SQL_MARK_SYNCED,
+                (datetime.now().isoformat(), _dump_response(response), log_id)
+            )
 
-        query = 'SELECT * FROM attendance_logs WHERE 1=1'
+    def mark_synced_bulk(self, pairs):
+        """
+        Mark many attendance logs as synced in a single transaction.
+
+        Args:
+            pairs: iterable of (log_id, response) tuples
+        """
+        # Serialize before taking the writer lock; one timestamp for the whole batch
+        synced_at = datetime.now().isoformat()
+        params = [(synced_at, _dump_response(response), log_id) for log_id, response in pairs]
+        if not params:
+            return
+        with self._writer() as cursor:
+            cursor.executemany(_SQL_MARK_SYNCED, params)
+
+    def _log_filters(self, search=None, status=None, device_id=None, date_from=None, date_to=None):
+        """Build the WHERE conditions shared by the attendance log queries."""
+        conditions = ''
         params = []
 
         if search:
-            query += ' AND user_id LIKE ?'
-            params.append(f'%{search}%')
+            # Trigrams cannot match terms shorter than three characters
+            if self._has_fts and len(search) >= 3:
+                conditions += ' AND id IN (SELECT rowid FROM attendance_fts WHERE attendance_fts MATCH ?)'
+                params.append('"{}"'.format(search.replace('"', '""')))
+            else:
+                conditions += ' AND user_id LIKE ?'
+                params.append(f'%{search}%')
 
         if status == 'synced':
-            query += ' AND synced = 1'
+            conditions += ' AND synced = 1'
         elif status == 'pending':
-            query += ' AND synced = 0'
+            conditions += ' AND synced = 0'
 
         if device_id:
-            query += ' AND device_id = ?'
+            conditions += ' AND device_id = ?'
             params.append(device_id)
 
+        # Half-open range on the raw column so idx_attendance_timestamp is used
         if date_from:
-            query += ' AND DATE(timestamp) >= ?'
-            params.append(date_from)
+            conditions += ' AND timestamp >= ?'
+            params.append(self._day_start(date_from))
 
         if date_to:
-            query += ' AND DATE(timestamp) <= ?'
-            params.append(date_to)
+            conditions += ' AND timestamp < ?'
+            params.append(self._day_start(date_to, offset_days=1))
+
+        return conditions, params
+
+    def count_attendance_logs(self, search=None, status=None, device_id=None,
+                              date_from=None, date_to=None):
+        """Count attendance logs matching the filters."""
+        # Reuse the last count while nothing has been written
+        cache_key = (search, status, device_id, date_from, date_to)
+        generation = self._write_generation
+        cached = self._count_cache.get(cache_key)
+        if cached and cached[0] == generation and cached[1] > time.monotonic():
+            return cached[2]
+
+        cursor = self.get_reader().cursor()
 
-        # Get total count
-        count_query = query.replace('SELECT *', 'SELECT COUNT(*)')
-        cursor.execute(count_query, params)
+        conditions, params = self._log_filters(search, status, device_id, date_from, date_to)
+        cursor.execute('SELECT COUNT(*) FROM attendance_logs WHERE 1=1' + conditions, params)
         total = cursor.fetchone()[0]
 
+        if len(self._count_cache) >= 256:
+            self._count_cache.clear()
+        self._count_cache[cache_key] = (generation, time.monotonic() + _COUNT_CACHE_TTL, total)
+        return total
+
+    def get_attendance_logs(self, page=1, limit=20, search=None, status=None,
+                            device_id=None, date_from=None, date_to=None):
+        """Get attendance logs with filters."""
+        total = self.count_attendance_logs(search, status, device_id, date_from, date_to)
+
+        cursor = self.get_reader().cursor()
+
+        conditions, params = self._log_filters(search, status, device_id, date_from, date_to)
+        query = 'SELECT * FROM attendance_logs WHERE 1=1' + conditions
+
         # Add pagination
         query += ' ORDER BY timestamp DESC LIMIT ? OFFSET ?'
         params.extend([limit, (page - 1) * limit])
 
         cursor.execute(query, params)
-        logs = self._rows_to_list(cursor.fetchall())
+        logs = self._logs_to_list(cursor.fetchall())
 
         return {'logs': logs, 'total': total}
 
+    def iter_attendance_logs(self, search=None, status=None, device_id=None,
+                             date_from=None, date_to=None, limit=None):
+        """
+        Yield attendance logs matching the filters, newest first, straight from the cursor.
+        At most `limit` rows are read when it is given.
+
+        Rows are sqlite3.Row objects of _SQL_LOG_COLUMNS, with the timestamp
+        already formatted as 'YYYY-MM-DD HH:MM:SS'.
+        """
+        cursor = self.get_reader().cursor()
+
+        conditions, params = self._log_filters(search, status, device_id, date_from, date_to)
+        query = f'SELECT {_SQL_LOG_COLUMNS} FROM attendance_logs WHERE 1=1' + conditions
+        query += ' ORDER BY attendance_logs.timestamp DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+
+        cursor.execute(query, params)
+        yield from cursor
+
+    def get_attendance_summary(self, device_id=None, date_from=None, date_to=None):
+        """
+        Aggregate matching attendance logs per user in SQL.
+
+        Returns:
+            list of sqlite3.Row (user_id, check_ins, check_outs, first_punch, last_punch)
+            ordered by user_id, with punches formatted as 'YYYY-MM-DD HH:MM:SS'
+        """
+        cursor = self.get_reader().cursor()
+
+        conditions, params = self._log_filters(device_id=device_id, date_from=date_from, date_to=date_to)
+        cursor.execute(
+            '''SELECT user_id,
+                      SUM(punch_type = 0) AS check_ins,
+                      SUM(punch_type IS NOT 0) AS check_outs,
+                      datetime(MIN(timestamp), 'unixepoch') AS first_punch,
+                      datetime(MAX(timestamp), 'unixepoch') AS last_punch
+               FROM attendance_logs WHERE 1=1''' + conditions +
+            ' GROUP BY user_id ORDER BY user_id',
+            params
+        )
+        return cursor.fetchall()
+
+    def get_last_log_time(self, device_id):
+        """Get the newest stored punch time of a device as a naive datetime, or None if it has no logs."""
+        cursor = self.get_reader().cursor()
+        cursor.execute('SELECT MAX(timestamp) FROM attendance_logs WHERE device_id = ?', (device_id,))
+        timestamp = cursor.fetchone()[0]
+        return None if timestamp is None else _EPOCH + timedelta(seconds=timestamp)
+
     def get_unsynced_logs(self, device_id=None):
         """Get unsynced attendance logs."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.get_reader().cursor()
 
         if device_id:
             cursor.execute(
@@ -361,45 +785,62 @@ class DatabaseManager:
                 'SELECT * FROM attendance_logs WHERE synced = 0 ORDER BY timestamp'
             )
 
-        return self._rows_to_list(cursor.fetchall())
+        return self._logs_to_list(cursor.fetchall())
+
+    def iter_unsynced_logs(self, device_id=None, chunk=1000):
+        """Yield unsynced attendance logs as sqlite3.Row, fetching `chunk` rows at a time."""
+        cursor = self.get_reader().cursor()
+
+        if device_id:
+            cursor.execute(
+                f'''SELECT {_SQL_LOG_COLUMNS} FROM attendance_logs
+                    WHERE synced = 0 AND device_id = ? ORDER BY attendance_logs.timestamp''',
+                (device_id,)
+            )
+        else:
+            cursor.execute(
+                f'''SELECT {_SQL_LOG_COLUMNS} FROM attendance_logs
+                    WHERE synced = 0 ORDER BY attendance_logs.timestamp'''
+            )
+
+        while True:
+            rows = cursor.fetchmany(chunk)
+            if not rows:
+                break
+            yield from rows
 
     # Sync history operations
     def create_sync_history(self, device_id):
         """Create a new sync history entry."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO sync_history (device_id, started_at)
-            VALUES (?, ?)
-        ''', (device_id, datetime.now().isoformat()))
-        conn.commit()
+        with self._writer() as cursor:
+            cursor.execute('''
+                INSERT INTO sync_history (device_id, started_at)
+                VALUES (?, ?)
+            ''', (device_id, datetime.now().isoformat()))
         return cursor.lastrowid
 
     def update_sync_history(self, history_id, records_fetched=0, records_synced=0,
                             records_failed=0, status='success', error_message=None):
         """Update sync history entry."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE sync_history
-            SET completed_at = ?, records_fetched = ?, records_synced = ?,
-                records_failed = ?, status = ?, error_message = ?
-            WHERE id = ?
-        ''', (
-            datetime.now().isoformat(),
-            records_fetched,
-            records_synced,
-            records_failed,
-            status,
-            error_message,
-            history_id
-        ))
-        conn.commit()
+        with self._writer() as cursor:
+            cursor.execute('''
+                UPDATE sync_history
+                SET completed_at = ?, records_fetched = ?, records_synced = ?,
+                    records_failed = ?, status = ?, error_message = ?
+                WHERE id = ?
+            ''', (
+                datetime.now().isoformat(),
+                records_fetched,
+                records_synced,
+                records_failed,
+                status,
+                error_message,
+                history_id
+            ))
 
     def get_sync_history(self, page=1, limit=20):
         """Get sync history."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.get_reader().cursor()
         cursor.execute('''
             SELECT * FROM sync_history
             ORDER BY started_at DESC
@@ -410,38 +851,44 @@ class DatabaseManager:
     # Config operations
     def save_config(self, key, value):
         """Save configuration value."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO config (key, value)
-            VALUES (?, ?)
-        ''', (key, json.dumps(value) if not isinstance(value, str) else value))
-        conn.commit()
+        with self._writer() as cursor:
+            cursor.execute('''
+                INSERT OR REPLACE INTO config (key, value)
+                VALUES (?, ?)
+            ''', (key, json.dumps(value) if not isinstance(value, str) else value))
+        self._config_cache.pop(key, None)
         return {'saved': True}
 
     def get_config(self, key):
-        """Get configuration value."""
-        cursor = self.get_connection().cursor()
+        """Get configuration value. The returned value is shared and must not be modified."""
+        if key in self._config_cache:
+            return self._config_cache[key]
+
+        cursor = self.get_reader().cursor()
         cursor.execute('SELECT value FROM config WHERE key = ?', (key,))
         row = cursor.fetchone()
+        value = None
         if row:
             try:
-                return json.loads(row['value'])
+                value = json.loads(row['value'])
             except (json.JSONDecodeError, TypeError):
-                return row['value']
-        return None
+                value = row['value']
+
+        self._config_cache[key] = value
+        return value
 
     def get_today_synced_count(self):
         """Get count of records synced today."""
-        cursor = self.get_connection().cursor()
+        cursor = self.get_reader().cursor()
+        today = date.today()
         cursor.execute('''
             SELECT COUNT(*) FROM attendance_logs
-            WHERE synced = 1 AND DATE(synced_at) = DATE('now')
-        ''')
+            WHERE synced = 1 AND synced_at >= ? AND synced_at < ?
+        ''', (today.isoformat(), (today + timedelta(days=1)).isoformat()))
         return cursor.fetchone()[0]
 
     def get_pending_count(self):
         """Get count of pending (unsynced) records."""
-        cursor = self.get_connection().cursor()
+        cursor = self.get_reader().cursor()
         cursor.execute('SELECT COUNT(*) FROM attendance_logs WHERE synced = 0')
         return cursor.fetchone()[0]
@@ -3,8 +3,25 @@ ERPNext API - Communication with ERPNext/HRMS.
 """
 
 import requests
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
 
+# Consecutive connection failures before check-ins stop hitting the server
+CIRCUIT_FAILURE_THRESHOLD = 5
+# How long the circuit stays open before one request is let through as a probe
+CIRCUIT_RESET_SECONDS = 60
+
+# Check-ins in flight at once across all callers; matches the session's pool size
+MAX_PUSH_WORKERS = 16
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of contacting an ERPNext server that keeps failing."""
+
 
 class ERPNextAPI:
     def __init__(self):
@@ -12,14 +29,58 @@ class ERPNextAPI:
         self.api_key = None
         self.api_secret = None
         self.version = 15
+        self._headers = {}
+        self._checkin_endpoint = None
+
+        # Circuit breaker state for push_checkin
+        self._circuit_lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._circuit_open_until = None
+        # Set while the single probe request of a half-open circuit is in flight
+        self._probe_in_flight = False
+
+        # Reuse TCP/TLS connections across calls instead of reconnecting per request.
+        # requests already negotiates gzip/deflate responses (plus br when brotli is
+        # installed), so large Employee/Shift Type listings arrive compressed.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=MAX_PUSH_WORKERS,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[502, 503, 504],
+                # POST is left out, so check-ins are only retried on connection errors, before
+                # the request reached the server; after a read error or 502/504 it may have
+                # been saved, and a resent one is rejected as a duplicate
+                raise_on_status=False
+            )
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Shared by every push_checkins_bulk call, so devices syncing in parallel
+        # never open more connections than the pool keeps alive
+        self._push_executor = ThreadPoolExecutor(max_workers=MAX_PUSH_WORKERS)
 
     def configure(self, url, api_key, api_secret, version=15):
         """Configure ERPNext connection settings."""
-        self.url = url.rstrip('/')
+        url = url.rstrip('/')
+        if (url, api_key, api_secret, version) == (self.url, self.api_key, self.api_secret, self.version):
+            return  # Unchanged; keep the session as it is
+
+        if url != self.url:
+            self._record_success()  # a new server starts with a closed circuit
+        self.url = url
         self.api_key = api_key
         self.api_secret = api_secret
         self.version = version
 
+        # Derived once here rather than on every request
+        self._headers = self._get_headers()
+        self._checkin_endpoint = self._get_checkin_endpoint()
+        self.session.headers.update(self._headers)
+
     def _get_headers(self):
         """Get request headers with authentication."""
         return {
@@ -37,15 +98,49 @@ class ERPNextAPI:
             # Older versions use ERPNext
             return '/api/method/erpnext.hr.doctype.employee_checkin.employee_checkin.add_log_based_on_employee_field'
 
+    def _check_circuit(self):
+        """
+        Fail fast while the circuit breaker is open.
+
+        Returns True when the reset window has passed and this caller is the one
+        probe let through; other callers keep failing fast until it finishes.
+        """
+        with self._circuit_lock:
+            if self._circuit_open_until is None:
+                return False
+            if time.monotonic() < self._circuit_open_until or self._probe_in_flight:
+                raise CircuitOpenError(f'ERPNext at {self.url} is unreachable, retrying later')
+            self._probe_in_flight = True
+            return True
+
+    def _end_probe(self):
+        """Let another probe through if this one ended without recording a result."""
+        with self._circuit_lock:
+            self._probe_in_flight = False
+
+    def _record_success(self):
+        """Close the circuit after any response from the server."""
+        with self._circuit_lock:
+            self._consecutive_failures = 0
+            self._circuit_open_until = None
+            self._probe_in_flight = False
+
+    def _record_failure(self):
+        """Count a connection failure, opening the circuit at the threshold or when the probe fails."""
+        with self._circuit_lock:
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD or self._probe_in_flight:
+                self._circuit_open_until = time.monotonic() + CIRCUIT_RESET_SECONDS
+            self._probe_in_flight = False
+
     def test_connection(self, url, api_key, api_secret, version=15):
         """Test connection to ERPNext."""
         self.configure(url, api_key, api_secret, version)
 
         try:
             # Test with a simple API call
-            response = requests.get(
+            response = self.session.get(
                 f'{self.url}/api/method/frappe.auth.get_logged_user',
-                headers=self._get_headers(),
                 timeout=10
             )
 
@@ -91,7 +186,7 @@ class ERPNextAPI:
         if not self.url or not self.api_key:
             raise Exception('ERPNext not configured')
 
-        endpoint = self._get_checkin_endpoint()
+        endpoint = self._checkin_endpoint
 
         payload = {
             'employee_field_value': str(employee_field_value),
@@ -106,13 +201,16 @@ class ERPNextAPI:
             payload['latitude'] = latitude
             payload['longitude'] = longitude
 
+        probe = self._check_circuit()
+
         try:
-            response = requests.post(
+            # Connection errors are already retried with backoff by the session adapter
+            response = self.session.post(
                 f'{self.url}{endpoint}',
-                headers=self._get_headers(),
                 json=payload,
                 timeout=30
             )
+            self._record_success()
 
             data = response.json()
 
@@ -124,16 +222,21 @@ class ERPNextAPI:
                 }
             else:
                 error_message = data.get('exc_type', '') or data.get('message', '') or str(data)
+                # exc_type is only the class name; the reason is in the exception text
+                error_detail = f"{error_message} {data.get('exception', '')} {data.get('_server_messages', '')}".lower()
 
                 # Check for allowable exceptions
                 allowable_errors = [
                     'No Employee found',
                     'This employee is Inactive',
                     'already checked in',
-                    'Duplicate'
+                    'Duplicate',
+                    # HRMS's ValidationError for a check-in it already saved, e.g. one whose
+                    # response was lost on an earlier sync
+                    'already has a log with the same timestamp'
                 ]
 
-                is_allowable = any(err.lower() in error_message.lower() for err in allowable_errors)
+                is_allowable = any(err.lower() in error_detail for err in allowable_errors)
 
                 if is_allowable:
                     return {
@@ -144,8 +247,36 @@ class ERPNextAPI:
 
                 raise Exception(error_message)
 
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            self._record_failure()
+            raise Exception(f'Request failed: {str(e)}')
         except requests.exceptions.RequestException as e:
             raise Exception(f'Request failed: {str(e)}')
+        finally:
+            if probe:
+                self._end_probe()
+
+    def push_checkins_bulk(self, checkins):
+        """
+        Push many check-in records to ERPNext concurrently.
+
+        Args:
+            checkins: list of dicts of push_checkin keyword arguments
+
+        Returns:
+            list of push_checkin results in the same order as checkins;
+            a record that raised is reported as {'success': False, 'message': ...}
+        """
+        if not checkins:
+            return []
+
+        def push(checkin):
+            try:
+                return self.push_checkin(**checkin)
+            except Exception as e:
+                return {'success': False, 'message': str(e)}
+
+        return list(self._push_executor.map(push, checkins))
 
     def get_shifts(self):
         """Get all shift types from ERPNext."""
@@ -153,9 +284,8 @@ class ERPNextAPI:
             raise Exception('ERPNext not configured')
 
         try:
-            response = requests.get(
+            response = self.session.get(
                 f'{self.url}/api/resource/Shift Type',
-                headers=self._get_headers(),
                 params={'fields': '["name", "start_time", "end_time"]'},
                 timeout=10
             )
@@ -175,9 +305,8 @@ class ERPNextAPI:
             raise Exception('ERPNext not configured')
 
         try:
-            response = requests.put(
+            response = self.session.put(
                 f'{self.url}/api/resource/Shift Type/{shift_type}',
-                headers=self._get_headers(),
                 json={'last_sync_of_checkin': last_sync_timestamp},
                 timeout=10
             )
@@ -201,9 +330,8 @@ class ERPNextAPI:
                 'filters': filters or '[]'
             }
 
-            response = requests.get(
+            response = self.session.get(
                 f'{self.url}/api/resource/Employee',
-                headers=self._get_headers(),
                 params=params,
                 timeout=10
             )
@@ -8,7 +8,8 @@ from pathlib import Path
 
 try:
     from openpyxl import Workbook
-    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
     from openpyxl.utils import get_column_letter
     HAS_OPENPYXL = True
 except ImportError:
@@ -19,46 +20,159 @@ try:
     from reportlab.lib.pagesizes import A4, landscape
     from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
     from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.platypus import SimpleDocTemplate, LongTable, TableStyle, Paragraph, Spacer
     HAS_REPORTLAB = True
 except ImportError:
     HAS_REPORTLAB = False
 
+# Reports are written through a 1 MiB buffer instead of the default 8 KiB
+_WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Detail rows included in a PDF report
+_PDF_ROW_LIMIT = 500
+
+# PDF cell labels indexed by (punch_type != 0) and bool(synced)
+_PUNCH_LABELS = ('In', 'Out')
+_STATUS_LABELS = ('Pending', 'Synced')
+
+
+def _split_timestamp(value):
+    """Split an ISO 'YYYY-MM-DD HH:MM:SS[.ffffff]' string into date and time strings."""
+    if not value:
+        return '', ''
+    # Fixed-width slices work for both ' ' and 'T' separators
+    return value[:10], value[11:19]
+
 
 class ExportService:
+    # PDF styles shared by every export, built on first use since ReportLab is optional
+    _pdf_styles = None
+
     def __init__(self, db):
         self.db = db
         # Default export directory
         self.export_dir = Path.home() / 'Documents' / 'BiometricSync Reports'
         self.export_dir.mkdir(parents=True, exist_ok=True)
 
-    def export_to_excel(self, params):
-        """Export attendance data to Excel."""
-        if not HAS_OPENPYXL:
-            raise Exception('Excel export not available. Install openpyxl: pip install openpyxl')
+    def _build_report_model(self, params):
+        """
+        Gather what both export formats need from the request params.
+
+        The same model can be passed to export_to_excel and export_to_pdf to
+        export both formats without querying twice. Detailed rows are not part
+        of it; each format streams them from the database.
 
+        Returns:
+            dict with date_from, date_to, filters (for the log queries), devices
+            ({id: name}), summary (per-user rows, None for a detailed report)
+            and records (log count of a summary report)
+        """
         date_from = params.get('dateFrom')
         date_to = params.get('dateTo')
         device_id = params.get('deviceId')
-        report_type = params.get('reportType', 'detailed')
-
-        # Get data
-        result = self.db.get_attendance_logs(
-            page=1,
-            limit=10000,  # Get all records
-            device_id=device_id if device_id else None,
-            date_from=date_from,
-            date_to=date_to
-        )
-        logs = result.get('logs', [])
 
-        # Get devices for lookup
-        devices = {d['id']: d['name'] for d in self.db.get_devices()}
+        filters = {
+            'device_id': device_id if device_id else None,
+            'date_from': date_from,
+            'date_to': date_to
+        }
 
-        # Create workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = 'Attendance Report'
+        summary = None
+        records = None
+        if params.get('reportType', 'detailed') != 'detailed':
+            # Aggregated by user in SQL
+            summary = self.db.get_attendance_summary(**filters)
+            records = sum(user['check_ins'] + user['check_outs'] for user in summary)
+
+        return {
+            'date_from': date_from,
+            'date_to': date_to,
+            'filters': filters,
+            'devices': {d['id']: d['name'] for d in self.db.get_devices()},
+            'summary': summary,
+            'records': records
+        }
+
+    @classmethod
+    def _get_pdf_styles(cls):
+        """Get the paragraph and table styles for PDF reports, building them once."""
+        if cls._pdf_styles is None:
+            sample = getSampleStyleSheet()
+            cls._pdf_styles = {
+                'title': ParagraphStyle(
+                    'Title',
+                    parent=sample['Heading1'],
+                    fontSize=18,
+                    alignment=1,  # Center
+                    spaceAfter=20
+                ),
+                'subtitle': ParagraphStyle(
+                    'Subtitle',
+                    parent=sample['Normal'],
+                    fontSize=12,
+                    alignment=1,
+                    spaceAfter=20
+                ),
+                'footer': ParagraphStyle(
+                    'Footer',
+                    parent=sample['Normal'],
+                    fontSize=8,
+                    alignment=1,
+                    textColor=colors.gray
+                ),
+                'table': TableStyle([
+                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4F81BD')),
+                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                    ('FONTSIZE', (0, 0), (-1, 0), 10),
+                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+                    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+                    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+                    ('FONTSIZE', (0, 1), (-1, -1), 8),
+                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F5F5F5')])
+                ])
+            }
+        return cls._pdf_styles
+
+    def _header_cells(self, ws, headers, font, fill, alignment, border):
+        """Build a styled header row for a write-only worksheet."""
+        cells = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.font = font
+            cell.fill = fill
+            cell.alignment = alignment
+            cell.border = border
+            cells.append(cell)
+        return cells
+
+    def _bordered_cells(self, ws, values):
+        """Wrap a data row in write-only cells using the workbook's 'bordered' style."""
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.style = 'bordered'
+            cells.append(cell)
+        return cells
+
+    def export_to_excel(self, params, model=None):
+        """Export attendance data to Excel, optionally from an already built report model."""
+        if not HAS_OPENPYXL:
+            raise Exception('Excel export not available. Install openpyxl: pip install openpyxl')
+
+        if model is None:
+            model = self._build_report_model(params)
+        date_from = model['date_from']
+        date_to = model['date_to']
+        devices = model['devices']
+        records = 0
+
+        # Create workbook; write-only mode streams rows to disk instead of keeping cells
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('Attendance Report')
 
         # Styles
         header_font = Font(bold=True, color='FFFFFF')
@@ -70,260 +184,171 @@ class ExportService:
             top=Side(style='thin'),
             bottom=Side(style='thin')
         )
+        # Registered once so every data cell shares a single style entry
+        wb.add_named_style(NamedStyle(name='bordered', border=border))
 
-        if report_type == 'detailed':
-            # Detailed report - all records
+        if model['summary'] is None:
+            # Detailed report - all records, streamed; none are retained once written
+            logs = self.db.iter_attendance_logs(**model['filters'])
             headers = ['S.No', 'User ID', 'Date', 'Time', 'Type', 'Device', 'Sync Status', 'Synced At']
-            ws.append(headers)
 
-            # Style headers
-            for col, header in enumerate(headers, 1):
-                cell = ws.cell(row=1, column=col)
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = header_alignment
-                cell.border = border
+            # Column widths must be set before any row is written
+            column_widths = [8, 15, 12, 10, 12, 20, 12, 20]
+            for i, width in enumerate(column_widths, 1):
+                ws.column_dimensions[get_column_letter(i)].width = width
+
+            ws.append(self._header_cells(ws, headers, header_font, header_fill, header_alignment, border))
 
             # Add data
             for idx, log in enumerate(logs, 1):
-                timestamp = datetime.fromisoformat(log['timestamp']) if log['timestamp'] else None
-                synced_at = datetime.fromisoformat(log['synced_at']) if log.get('synced_at') else None
+                records = idx
+                date_s, time_s = _split_timestamp(log['timestamp'])
+                synced_date, synced_time = _split_timestamp(log['synced_at'])
 
                 row = [
                     idx,
                     log['user_id'],
-                    timestamp.strftime('%Y-%m-%d') if timestamp else '',
-                    timestamp.strftime('%H:%M:%S') if timestamp else '',
-                    'Check In' if log.get('punch_type', 0) == 0 else 'Check Out',
-                    devices.get(log.get('device_id'), 'Unknown'),
-                    'Synced' if log.get('synced') else 'Pending',
-                    synced_at.strftime('%Y-%m-%d %H:%M:%S') if synced_at else ''
+                    date_s,
+                    time_s,
+                    'Check In' if log['punch_type'] == 0 else 'Check Out',
+                    devices.get(log['device_id'], 'Unknown'),
+                    'Synced' if log['synced'] else 'Pending',
+                    f'{synced_date} {synced_time}' if synced_date else ''
                 ]
-                ws.append(row)
-
-                # Apply border to data cells
-                for col in range(1, len(headers) + 1):
-                    ws.cell(row=idx + 1, column=col).border = border
-
-            # Set column widths
-            column_widths = [8, 15, 12, 10, 12, 20, 12, 20]
-            for i, width in enumerate(column_widths, 1):
-                ws.column_dimensions[get_column_letter(i)].width = width
+                ws.append(self._bordered_cells(ws, row))
 
         else:
             # Summary report - aggregated by user
-            summary = {}
-            for log in logs:
-                user_id = log['user_id']
-                if user_id not in summary:
-                    summary[user_id] = {
-                        'check_ins': 0,
-                        'check_outs': 0,
-                        'first_punch': None,
-                        'last_punch': None
-                    }
-
-                timestamp = datetime.fromisoformat(log['timestamp']) if log['timestamp'] else None
-
-                if log.get('punch_type', 0) == 0:
-                    summary[user_id]['check_ins'] += 1
-                else:
-                    summary[user_id]['check_outs'] += 1
-
-                if timestamp:
-                    if summary[user_id]['first_punch'] is None or timestamp < summary[user_id]['first_punch']:
-                        summary[user_id]['first_punch'] = timestamp
-                    if summary[user_id]['last_punch'] is None or timestamp > summary[user_id]['last_punch']:
-                        summary[user_id]['last_punch'] = timestamp
+            summary = model['summary']
+            records = model['records']
 
             headers = ['S.No', 'User ID', 'Total Check-Ins', 'Total Check-Outs', 'First Punch', 'Last Punch']
-            ws.append(headers)
 
-            # Style headers
-            for col, header in enumerate(headers, 1):
-                cell = ws.cell(row=1, column=col)
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = header_alignment
-                cell.border = border
+            # Column widths must be set before any row is written
+            column_widths = [8, 15, 15, 15, 18, 18]
+            for i, width in enumerate(column_widths, 1):
+                ws.column_dimensions[get_column_letter(i)].width = width
+
+            ws.append(self._header_cells(ws, headers, header_font, header_fill, header_alignment, border))
 
             # Add data
-            for idx, (user_id, data) in enumerate(sorted(summary.items()), 1):
+            for idx, user in enumerate(summary, 1):
                 row = [
                     idx,
-                    user_id,
-                    data['check_ins'],
-                    data['check_outs'],
-                    data['first_punch'].strftime('%Y-%m-%d %H:%M') if data['first_punch'] else '',
-                    data['last_punch'].strftime('%Y-%m-%d %H:%M') if data['last_punch'] else ''
+                    user['user_id'],
+                    user['check_ins'],
+                    user['check_outs'],
+                    user['first_punch'][:16],
+                    user['last_punch'][:16]
                 ]
-                ws.append(row)
-
-                for col in range(1, len(headers) + 1):
-                    ws.cell(row=idx + 1, column=col).border = border
-
-            # Set column widths
-            column_widths = [8, 15, 15, 15, 18, 18]
-            for i, width in enumerate(column_widths, 1):
-                ws.column_dimensions[get_column_letter(i)].width = width
+                ws.append(self._bordered_cells(ws, row))
 
         # Save file
         filename = f'attendance_report_{date_from}_to_{date_to}.xlsx'
         filepath = self.export_dir / filename
-        wb.save(str(filepath))
+        with open(filepath, 'wb', buffering=_WRITE_BUFFER_SIZE) as fh:
+            wb.save(fh)
 
         return {
             'success': True,
             'path': str(filepath),
-            'records': len(logs)
+            'records': records
         }
 
-    def export_to_pdf(self, params):
-        """Export attendance data to PDF."""
+    def export_to_pdf(self, params, model=None):
+        """Export attendance data to PDF, optionally from an already built report model."""
         if not HAS_REPORTLAB:
             raise Exception('PDF export not available. Install reportlab: pip install reportlab')
 
-        date_from = params.get('dateFrom')
-        date_to = params.get('dateTo')
-        device_id = params.get('deviceId')
-        report_type = params.get('reportType', 'detailed')
-
-        # Get data
-        result = self.db.get_attendance_logs(
-            page=1,
-            limit=10000,
-            device_id=device_id if device_id else None,
-            date_from=date_from,
-            date_to=date_to
-        )
-        logs = result.get('logs', [])
-
-        # Get devices for lookup
-        devices = {d['id']: d['name'] for d in self.db.get_devices()}
+        if model is None:
+            model = self._build_report_model(params)
+        date_from = model['date_from']
+        date_to = model['date_to']
+        devices = model['devices']
+        records = 0
 
         # Create PDF
         filename = f'attendance_report_{date_from}_to_{date_to}.pdf'
         filepath = self.export_dir / filename
 
-        doc = SimpleDocTemplate(
-            str(filepath),
-            pagesize=landscape(A4),
-            rightMargin=30,
-            leftMargin=30,
-            topMargin=30,
-            bottomMargin=30
-        )
-
         elements = []
-        styles = getSampleStyleSheet()
+        styles = self._get_pdf_styles()
 
         # Title
-        title_style = ParagraphStyle(
-            'Title',
-            parent=styles['Heading1'],
-            fontSize=18,
-            alignment=1,  # Center
-            spaceAfter=20
-        )
-        elements.append(Paragraph('Attendance Report', title_style))
+        elements.append(Paragraph('Attendance Report', styles['title']))
 
         # Subtitle with date range
-        subtitle_style = ParagraphStyle(
-            'Subtitle',
-            parent=styles['Normal'],
-            fontSize=12,
-            alignment=1,
-            spaceAfter=20
-        )
-        elements.append(Paragraph(f'Period: {date_from} to {date_to}', subtitle_style))
+        elements.append(Paragraph(f'Period: {date_from} to {date_to}', styles['subtitle']))
         elements.append(Spacer(1, 20))
 
-        # Table style
-        table_style = TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4F81BD')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F5F5F5')])
-        ])
-
-        if report_type == 'detailed':
+        if model['summary'] is None:
             headers = ['#', 'User ID', 'Date', 'Time', 'Type', 'Device', 'Status']
-            data = [headers]
 
-            for idx, log in enumerate(logs[:500], 1):  # Limit to 500 for PDF
-                timestamp = datetime.fromisoformat(log['timestamp']) if log['timestamp'] else None
-                row = [
+            # Limit to the newest 500 for PDF, read straight from the cursor; timestamps
+            # are sliced rather than parsed
+            logs = self.db.iter_attendance_logs(limit=_PDF_ROW_LIMIT, **model['filters'])
+            device_names = {key: name[:15] for key, name in devices.items()}
+            devget = device_names.get
+            data = [headers] + [
+                [
                     str(idx),
                     log['user_id'],
-                    timestamp.strftime('%Y-%m-%d') if timestamp else '',
-                    timestamp.strftime('%H:%M:%S') if timestamp else '',
-                    'In' if log.get('punch_type', 0) == 0 else 'Out',
-                    devices.get(log.get('device_id'), 'Unknown')[:15],
-                    'Synced' if log.get('synced') else 'Pending'
+                    log['timestamp'][:10],
+                    log['timestamp'][11:19],
+                    _PUNCH_LABELS[log['punch_type'] != 0],
+                    devget(log['device_id'], 'Unknown'),
+                    _STATUS_LABELS[bool(log['synced'])]
                 ]
-                data.append(row)
+                for idx, log in enumerate(logs, 1)
+            ]
+            records = self.db.count_attendance_logs(**model['filters'])
 
             col_widths = [30, 80, 80, 60, 50, 120, 60]
 
         else:
-            # Summary
-            summary = {}
-            for log in logs:
-                user_id = log['user_id']
-                if user_id not in summary:
-                    summary[user_id] = {'check_ins': 0, 'check_outs': 0}
-
-                if log.get('punch_type', 0) == 0:
-                    summary[user_id]['check_ins'] += 1
-                else:
-                    summary[user_id]['check_outs'] += 1
+            summary = model['summary']
+            records = model['records']
 
             headers = ['#', 'User ID', 'Check-Ins', 'Check-Outs', 'Total']
             data = [headers]
 
-            for idx, (user_id, stats) in enumerate(sorted(summary.items()), 1):
-                total = stats['check_ins'] + stats['check_outs']
+            for idx, user in enumerate(summary, 1):
                 row = [
                     str(idx),
-                    user_id,
-                    str(stats['check_ins']),
-                    str(stats['check_outs']),
-                    str(total)
+                    user['user_id'],
+                    str(user['check_ins']),
+                    str(user['check_outs']),
+                    str(user['check_ins'] + user['check_outs'])
                 ]
                 data.append(row)
 
             col_widths = [40, 120, 100, 100, 100]
 
-        table = Table(data, colWidths=col_widths)
-        table.setStyle(table_style)
+        # Fixed widths skip autosizing; LongTable splits across pages cheaply and repeats the header
+        table = LongTable(data, colWidths=col_widths, repeatRows=1)
+        table.setStyle(styles['table'])
         elements.append(table)
 
         # Footer
         elements.append(Spacer(1, 20))
-        footer_style = ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=8,
-            alignment=1,
-            textColor=colors.gray
-        )
         elements.append(Paragraph(
-            f'Generated on {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} | Total Records: {len(logs)}',
-            footer_style
+            f'Generated on {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} | Total Records: {records}',
+            styles['footer']
         ))
 
-        doc.build(elements)
+        with open(filepath, 'wb', buffering=_WRITE_BUFFER_SIZE) as fh:
+            doc = SimpleDocTemplate(
+                fh,
+                pagesize=landscape(A4),
+                rightMargin=30,
+                leftMargin=30,
+                topMargin=30,
+                bottomMargin=30
+            )
+            doc.build(elements)
 
         return {
             'success': True,
             'path': str(filepath),
-            'records': len(logs)
+            'records': records
         }
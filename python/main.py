@@ -6,8 +6,17 @@ Handles JSON-RPC style communication with Electron.
 
 import sys
 import os
+import io
 import json
 import traceback
+from array import array
+from datetime import date
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
 
 # Add the script directory to Python path for imports
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -21,11 +30,13 @@ erpnext_api = None
 sync_engine = None
 export_service = None
 _init_error = None
+# Method name -> handler taking the request params, built once services exist
+_handlers = {}
 
 
 def _initialize_services():
     """Initialize all services. Called lazily."""
-    global db, zk_service, erpnext_api, sync_engine, export_service, _init_error
+    global db, zk_service, erpnext_api, sync_engine, export_service, _init_error, _handlers
 
     if _init_error:
         raise _init_error
@@ -45,6 +56,7 @@ def _initialize_services():
         erpnext_api = ERPNextAPI()
         sync_engine = SyncEngine(db, zk_service, erpnext_api)
         export_service = ExportService(db)
+        _handlers = _build_handlers()
     except ImportError as e:
         _init_error = ImportError(f"Failed to import required module: {e}. Please run: pip install -r requirements.txt")
         raise _init_error
@@ -53,46 +65,24 @@ def _initialize_services():
         raise
 
 
-def handle_request(request):
-    """Process a JSON-RPC request and return response."""
-    method = request.get('method')
-    params = request.get('params', {})
-    request_id = request.get('id')
-
-    try:
-        result = dispatch_method(method, params)
-        return {'result': result, 'id': request_id}
-    except Exception as e:
-        return {
-            'error': {
-                'code': -1,
-                'message': str(e),
-                'traceback': traceback.format_exc()
-            },
-            'id': request_id
-        }
-
-
-def dispatch_method(method, params):
-    """Dispatch method to appropriate handler."""
-    # Initialize services on first call
-    _initialize_services()
-
-    handlers = {
+def _build_handlers():
+    """Build the RPC dispatch table over the initialized services."""
+    return {
         # Initialization
         'initialize': lambda p: db.initialize(),
+        'run_maintenance': lambda p: db.maintenance(),
 
         # Device operations
         'get_devices': lambda p: db.get_devices(),
-        'add_device': lambda p: db.add_device(p),
-        'update_device': lambda p: db.update_device(p),
+        'add_device': db.add_device,
+        'update_device': db.update_device,
         'delete_device': lambda p: db.delete_device(p['id']),
         'test_device_connection': lambda p: zk_service.test_connection(p['ip'], p.get('port', 4370)),
 
         # Shift operations
         'get_shifts': lambda p: db.get_shifts(),
-        'add_shift': lambda p: db.add_shift(p),
-        'update_shift': lambda p: db.update_shift(p),
+        'add_shift': db.add_shift,
+        'update_shift': db.update_shift,
         'delete_shift': lambda p: db.delete_shift(p['id']),
 
         # Sync operations
@@ -115,28 +105,88 @@ def dispatch_method(method, params):
         ),
 
         # Export operations
-        'export_to_excel': lambda p: export_service.export_to_excel(p),
-        'export_to_pdf': lambda p: export_service.export_to_pdf(p),
+        'export_to_excel': export_service.export_to_excel,
+        'export_to_pdf': export_service.export_to_pdf,
 
         # Config operations
         'save_config': lambda p: db.save_config(p['key'], p['value']),
         'get_config': lambda p: db.get_config(p['key']),
     }
 
-    handler = handlers.get(method)
+
+def handle_request(request):
+    """Process a JSON-RPC request and return response."""
+    method = request.get('method')
+    params = request.get('params', {})
+    request_id = request.get('id')
+
+    try:
+        result = dispatch_method(method, params)
+        return {'result': result, 'id': request_id}
+    except Exception as e:
+        return {
+            'error': {
+                'code': -1,
+                'message': str(e),
+                'traceback': traceback.format_exc()
+            },
+            'id': request_id
+        }
+
+
+def dispatch_method(method, params):
+    """Dispatch method to appropriate handler."""
+    # Initialize services on first call
+    _initialize_services()
+
+    handler = _handlers.get(method)
     if handler is None:
         raise ValueError(f'Unknown method: {method}')
 
     return handler(params)
 
 
+def _loads(line):
+    """Parse one request line of UTF-8 bytes."""
+    if HAS_ORJSON:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+def _json_default(value):
+    """Serialize the values either JSON encoder lacks: dates for json, arrays for both."""
+    if isinstance(value, date):
+        # Same form orjson writes natively for naive datetimes
+        return value.isoformat()
+    if isinstance(value, array):
+        return value.tolist()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def _dumps(response):
+    """Serialize a response to UTF-8 JSON bytes."""
+    if HAS_ORJSON:
+        return orjson.dumps(response, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(response, default=_json_default).encode()
+
+
+def _send(response):
+    """Write one response line to stdout."""
+    out = sys.stdout.buffer
+    out.write(_dumps(response) + b'\n')
+    # Electron waits on each reply, so every response is flushed immediately
+    out.flush()
+
+
 def main():
     """Main loop for processing stdin commands."""
-    for line in sys.stdin:
+    # Read raw bytes: both parsers take UTF-8 bytes, so no text decoding pass is needed
+    reader = io.BufferedReader(sys.stdin.buffer.raw, buffer_size=131072)
+    for line in iter(reader.readline, b''):
         try:
-            request = json.loads(line.strip())
+            request = _loads(line)
             response = handle_request(request)
-            print(json.dumps(response), flush=True)
+            _send(response)
         except json.JSONDecodeError as e:
             error_response = {
                 'error': {
@@ -145,7 +195,7 @@ def main():
                 },
                 'id': None
             }
-            print(json.dumps(error_response), flush=True)
+            _send(error_response)
         except Exception as e:
             error_response = {
                 'error': {
@@ -154,7 +204,13 @@ def main():
                 },
                 'id': None
             }
-            print(json.dumps(error_response), flush=True)
+            _send(error_response)
+
+    # stdin closed: the Electron side is shutting us down
+    if zk_service is not None:
+        zk_service.disconnect_all()
+    if db is not None:
+        db.close()
 
 
 if __name__ == '__main__':
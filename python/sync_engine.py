@@ -2,9 +2,21 @@
 Sync Engine - Orchestrates the sync process between devices and ERPNext.
 """
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from itertools import islice
+import threading
 import traceback
 
+# Pending logs pushed to ERPNext per round when draining the backlog
+PENDING_BATCH_SIZE = 100
+
+# Devices synced at the same time by run_sync
+MAX_DEVICE_WORKERS = 8
+
+# Device records stored and pushed per round, bounding memory for large device logs
+FETCH_CHUNK_SIZE = 1000
+
 
 class SyncEngine:
     def __init__(self, db, zk_service, erpnext_api):
@@ -13,8 +25,30 @@ class SyncEngine:
         self.erpnext_api = erpnext_api
         self.is_running = False
         self.current_progress = 0
+        self._progress_lock = threading.Lock()
         self.last_sync = None
         self.last_error = None
+        # {device_id: device}, rebuilt at the start of each sync
+        self._device_cache = None
+
+    def _get_device_map(self):
+        """Get all devices keyed by id, loading them once per sync."""
+        if self._device_cache is None:
+            self._device_cache = {d['id']: d for d in self.db.get_devices()}
+        return self._device_cache
+
+    def _configure_erpnext(self):
+        """Apply the saved ERPNext config; the client ignores it when nothing changed."""
+        config = self.db.get_config('erpnext')
+        if not config:
+            raise Exception('ERPNext not configured')
+
+        self.erpnext_api.configure(
+            config.get('url'),
+            config.get('apiKey'),
+            config.get('apiSecret'),
+            config.get('version', 15)
+        )
 
     def get_status(self):
         """Get current sync status."""
@@ -35,6 +69,7 @@ class SyncEngine:
         self.is_running = True
         self.current_progress = 0
         self.last_error = None
+        self._device_cache = None
 
         total_fetched = 0
         total_synced = 0
@@ -43,7 +78,7 @@ class SyncEngine:
 
         try:
             # Get enabled devices
-            devices = [d for d in self.db.get_devices() if d.get('enabled', True)]
+            devices = [d for d in self._get_device_map().values() if d.get('enabled', True)]
 
             if not devices:
                 return {
@@ -51,29 +86,25 @@ class SyncEngine:
                     'message': 'No enabled devices found'
                 }
 
-            # Get ERPNext config
-            config = self.db.get_config('erpnext')
-            if not config:
-                raise Exception('ERPNext not configured')
+            self._configure_erpnext()
 
-            self.erpnext_api.configure(
-                config.get('url'),
-                config.get('apiKey'),
-                config.get('apiSecret'),
-                config.get('version', 15)
-            )
+            # Process devices concurrently; each one is mostly waiting on the network
+            with ThreadPoolExecutor(max_workers=min(MAX_DEVICE_WORKERS, len(devices))) as executor:
+                futures = [executor.submit(self._sync_device, device) for device in devices]
+
+                for index, future in enumerate(as_completed(futures)):
+                    device_result = future.result()
 
-            # Process each device
-            for index, device in enumerate(devices):
-                device_result = self._sync_device(device)
-                device_results.append(device_result)
+                    total_fetched += device_result.get('records_fetched', 0)
+                    total_synced += device_result.get('records_synced', 0)
+                    total_failed += device_result.get('records_failed', 0)
 
-                total_fetched += device_result.get('records_fetched', 0)
-                total_synced += device_result.get('records_synced', 0)
-                total_failed += device_result.get('records_failed', 0)
+                    # Update progress
+                    with self._progress_lock:
+                        self.current_progress = int(((index + 1) / len(devices)) * 100)
 
-                # Update progress
-                self.current_progress = int(((index + 1) / len(devices)) * 100)
+            # Report devices in their configured order, not completion order
+            device_results = [future.result() for future in futures]
 
             self.last_sync = datetime.now().isoformat()
 
@@ -112,56 +143,62 @@ class SyncEngine:
             # Update device status
             self.db.update_device_status(device_id, 'syncing')
 
-            # Fetch attendance from device
-            attendance_records = self.zk_service.get_attendance(
+            # Fetch attendance from device, skipping what earlier syncs already stored.
+            # Records from the newest stored punch on come back again, as does the whole
+            # log after a clear or clock reset; the dedup key drops the ones already stored.
+            attendance_records = self.zk_service.iter_attendance_rows(
                 device['ip'],
-                device.get('port', 4370)
+                device.get('port', 4370),
+                since=self.db.get_last_log_time(device_id),
+                # Stored as epoch seconds, so skip formatting them only to parse them back
+                format_timestamps=False
             )
 
-            records_fetched = len(attendance_records)
-
-            # Store and sync each record
-            for record in attendance_records:
-                try:
-                    # Store in local database
-                    log_id = self.db.add_attendance_log(
-                        device_id=device_id,
-                        user_id=record['user_id'],
-                        timestamp=record['timestamp'],
-                        punch_type=record.get('punch_type', 0)
-                    )
-
-                    if log_id is None:
-                        # Duplicate record, skip
-                        continue
-
-                    # Determine log type
-                    log_type = None
-                    punch_direction = device.get('punch_direction')
-                    if punch_direction == 'IN':
-                        log_type = 'IN'
-                    elif punch_direction == 'OUT':
-                        log_type = 'OUT'
-                    # If AUTO or None, let ERPNext decide
-
-                    # Push to ERPNext
-                    result = self.erpnext_api.push_checkin(
-                        employee_field_value=record['user_id'],
-                        timestamp=record['timestamp'],
-                        device_id=device.get('name', str(device_id)),
-                        log_type=log_type,
-                        latitude=device.get('latitude'),
-                        longitude=device.get('longitude')
-                    )
-
+            # Determine log type
+            log_type = None
+            punch_direction = device.get('punch_direction')
+            if punch_direction == 'IN':
+                log_type = 'IN'
+            elif punch_direction == 'OUT':
+                log_type = 'OUT'
+            # If AUTO or None, let ERPNext decide
+
+            while True:
+                chunk = list(islice(attendance_records, FETCH_CHUNK_SIZE))
+                if not chunk:
+                    break
+                records_fetched += len(chunk)
+
+                # Store each chunk in one transaction, keeping only new logs
+                new_logs = self.db.add_attendance_logs_bulk([
+                    (device_id, user_id, timestamp, punch_type)
+                    for user_id, timestamp, punch_type, _status in chunk
+                ])
+
+                # Push the new records to ERPNext concurrently
+                results = self.erpnext_api.push_checkins_bulk([
+                    {
+                        'employee_field_value': log['user_id'],
+                        'timestamp': log['timestamp'],
+                        'device_id': device.get('name', str(device_id)),
+                        'log_type': log_type,
+                        'latitude': device.get('latitude'),
+                        'longitude': device.get('longitude')
+                    }
+                    for log in new_logs
+                ])
+
+                synced_pairs = []
+                for log, result in zip(new_logs, results):
                     if result.get('success') or result.get('skipped'):
-                        self.db.update_attendance_synced(log_id, result)
-                        records_synced += 1
+                        synced_pairs.append((log['id'], result))
                     else:
                         records_failed += 1
+                        # Keep the reason in the sync history instead of dropping it
+                        error_message = result.get('message')
 
-                except Exception as e:
-                    records_failed += 1
+                self.db.mark_synced_bulk(synced_pairs)
+                records_synced += len(synced_pairs)
 
             # Update device status
             self.db.update_device_status(device_id, 'online', datetime.now().isoformat())
@@ -199,61 +236,27 @@ class SyncEngine:
             return {'status': 'sync_in_progress'}
 
         self.is_running = True
+        self._device_cache = None
 
         try:
-            # Get ERPNext config
-            config = self.db.get_config('erpnext')
-            if not config:
-                raise Exception('ERPNext not configured')
-
-            self.erpnext_api.configure(
-                config.get('url'),
-                config.get('apiKey'),
-                config.get('apiSecret'),
-                config.get('version', 15)
-            )
+            self._configure_erpnext()
 
-            # Get unsynced records
-            pending_logs = self.db.get_unsynced_logs()
+            # Stream unsynced records and push them in batches
             synced = 0
             failed = 0
-
-            for log in pending_logs:
-                try:
-                    # Get device info for this log
-                    devices = self.db.get_devices()
-                    device = next((d for d in devices if d['id'] == log['device_id']), None)
-
-                    log_type = None
-                    latitude = None
-                    longitude = None
-
-                    if device:
-                        punch_direction = device.get('punch_direction')
-                        if punch_direction == 'IN':
-                            log_type = 'IN'
-                        elif punch_direction == 'OUT':
-                            log_type = 'OUT'
-                        latitude = device.get('latitude')
-                        longitude = device.get('longitude')
-
-                    result = self.erpnext_api.push_checkin(
-                        employee_field_value=log['user_id'],
-                        timestamp=log['timestamp'],
-                        device_id=device.get('name') if device else str(log['device_id']),
-                        log_type=log_type,
-                        latitude=latitude,
-                        longitude=longitude
-                    )
-
-                    if result.get('success') or result.get('skipped'):
-                        self.db.update_attendance_synced(log['id'], result)
-                        synced += 1
-                    else:
-                        failed += 1
-
-                except Exception as e:
-                    failed += 1
+            batch = []
+            for log in self.db.iter_unsynced_logs():
+                batch.append(log)
+                if len(batch) >= PENDING_BATCH_SIZE:
+                    batch_synced, batch_failed = self._push_pending_logs(batch)
+                    synced += batch_synced
+                    failed += batch_failed
+                    batch = []
+
+            if batch:
+                batch_synced, batch_failed = self._push_pending_logs(batch)
+                synced += batch_synced
+                failed += batch_failed
 
             return {
                 'status': 'success',
@@ -269,3 +272,46 @@ class SyncEngine:
 
         finally:
             self.is_running = False
+
+    def _push_pending_logs(self, pending_logs):
+        """Push a batch of stored logs to ERPNext and mark the synced ones. Returns (synced, failed)."""
+        checkins = []
+        device_map = self._get_device_map()
+
+        for log in pending_logs:
+            device = device_map.get(log['device_id'])
+
+            log_type = None
+            latitude = None
+            longitude = None
+
+            if device:
+                punch_direction = device.get('punch_direction')
+                if punch_direction == 'IN':
+                    log_type = 'IN'
+                elif punch_direction == 'OUT':
+                    log_type = 'OUT'
+                latitude = device.get('latitude')
+                longitude = device.get('longitude')
+
+            checkins.append({
+                'employee_field_value': log['user_id'],
+                'timestamp': log['timestamp'],
+                'device_id': device.get('name') if device else str(log['device_id']),
+                'log_type': log_type,
+                'latitude': latitude,
+                'longitude': longitude
+            })
+
+        results = self.erpnext_api.push_checkins_bulk(checkins)
+
+        synced_pairs = []
+        failed = 0
+        for log, result in zip(pending_logs, results):
+            if result.get('success') or result.get('skipped'):
+                synced_pairs.append((log['id'], result))
+            else:
+                failed += 1
+
+        self.db.mark_synced_bulk(synced_pairs)
+        return len(synced_pairs), failed
@@ -2,85 +2,472 @@
 ZK Service - Communication with ZKTeco biometric devices.
 """
 
-from zk import ZK
+from zk import ZK, const
+from zk.attendance import Attendance
+from zk.exception import ZKErrorConnection, ZKErrorResponse, ZKNetworkError
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+import logging
 import socket
+import struct
+import threading
+import time
+
+# Devices polled at the same time by the *_many methods
+MAX_DEVICE_WORKERS = 16
+
+# Seconds firmware/serial/platform/mac are trusted before being read from the device again;
+# they only change with a firmware update, after which the connection is dropped anyway
+DEVICE_INFO_TTL = 3600
+
+# Seconds a device host name stays resolved to the same address
+DNS_CACHE_TTL = 300
+
+# Seconds between keep-alive rounds over idle pooled connections
+HEARTBEAT_INTERVAL = 45
+# Seconds a keep-alive ping may take before its connection is considered dead
+HEARTBEAT_TIMEOUT = 2
+
+# Attendance record layouts by record size, as sent by the different firmware generations
+_ATTENDANCE_8 = struct.Struct('<HBIB')        # uid, status, time, punch
+_ATTENDANCE_16 = struct.Struct('<IIBB2xI')    # user_id, time, status, punch, workcode
+_ATTENDANCE_40 = struct.Struct('<H24sBIB8x')  # uid, user_id, status, time, punch
+
+# Errors meaning the socket to the device is no longer usable
+_CONNECTION_ERRORS = (OSError, ZKErrorConnection, ZKNetworkError)
+# Errors a device command can fail with, including the device refusing it
+_DEVICE_ERRORS = _CONNECTION_ERRORS + (ZKErrorResponse,)
+
+# pyzk refusals of single-reply commands, raised after the whole reply was read, so the
+# connection is still in step. Any other failure may leave reply frames unread on it
+_CLEAN_REFUSALS = frozenset({
+    "Can't disable device",
+    "Can't enable device",
+    "can't read sizes",
+    "can't get time",
+    "can't set time",
+    "Can't clear response",
+    "Can't read frimware version",  # sic, as pyzk spells it
+    "Can't read serial number",
+    "Can't read platform name",
+    "can't read mac address"
+})
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _device_disabled(conn):
+    """Lock user activity on the device while an operation runs, re-enabling it even on failure."""
+    conn.disable_device()
+    try:
+        yield conn
+    except BaseException:
+        try:
+            conn.enable_device()
+        except _DEVICE_ERRORS:
+            pass  # Report the original failure, not this one
+        raise
+    conn.enable_device()
+
+
+def _device_socket(conn):
+    """Get the socket pyzk keeps private on a connection, or None if this pyzk has none."""
+    return getattr(conn, '_ZK__sock', None)
+
+
+def _close_socket(conn):
+    """Close a connection's socket directly, skipping the exit handshake."""
+    sock = _device_socket(conn)
+    if sock is not None:
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+
+def _tune_socket(conn):
+    """Disable Nagle and enable TCP keep-alive on a connection's socket, when it is TCP."""
+    sock = _device_socket(conn)
+    if sock is None or sock.type != socket.SOCK_STREAM:
+        return  # Older pyzk, or a device only reachable over UDP
+
+    try:
+        # Commands are small request/response pairs; don't hold them back waiting for ACKs
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # Probe after 30 s idle, every 10 s, giving up after 3 misses (Linux only)
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+    except OSError:
+        pass
+
+
+def _decode_time(t):
+    """Decode a device timestamp (seconds packed with 31-day months from 2000)."""
+    t, second = divmod(t, 60)
+    t, minute = divmod(t, 60)
+    t, hour = divmod(t, 24)
+    t, day = divmod(t, 31)
+    year, month = divmod(t, 12)
+    return datetime(year + 2000, month + 1, day + 1, hour, minute, second)
+
+
+def _fetch_attendance(conn):
+    """
+    Download and decode a device's attendance log, giving the same records as pyzk's get_attendance.
+
+    pyzk re-slices the remaining buffer after every record and scans every user
+    per record, which is quadratic in the log size. This decodes the buffer with
+    struct.iter_unpack and looks users up in dicts, keeping the work linear.
+    """
+    if not hasattr(conn, 'read_with_buffer'):
+        return conn.get_attendance()  # pyzk without the buffered read API
+
+    conn.read_sizes()
+    if conn.records == 0:
+        return []
+    users = conn.get_users()
+    data, size = conn.read_with_buffer(const.CMD_ATTLOG_RRQ)
+    if size < 4:
+        return []
+    record_size = struct.unpack('<I', data[:4])[0] / conn.records
+    data = data[4:]
+
+    # First match wins, as with pyzk's filter()[0]
+    by_uid = {}
+    by_user_id = {}
+    for user in users:
+        by_uid.setdefault(user.uid, user)
+        by_user_id.setdefault(user.user_id, user)
+
+    attendance = []
+    append = attendance.append
+    if record_size == 8:
+        data = data[:len(data) - len(data) % 8]
+        for uid, status, timestamp, punch in _ATTENDANCE_8.iter_unpack(data):
+            user = by_uid.get(uid)
+            user_id = user.user_id if user is not None else str(uid)
+            append(Attendance(user_id, _decode_time(timestamp), status, punch, uid))
+    elif record_size == 16:
+        data = data[:len(data) - len(data) % 16]
+        for user_id, timestamp, status, punch, _workcode in _ATTENDANCE_16.iter_unpack(data):
+            user_id = str(user_id)
+            user = by_user_id.get(user_id)
+            if user is not None:
+                uid = user.uid
+            else:
+                # pyzk then matches the id against uids too
+                user = by_uid.get(user_id)
+                if user is None:
+                    uid = user_id
+                else:
+                    uid, user_id = user.uid, user.user_id
+            append(Attendance(user_id, _decode_time(timestamp), status, punch, uid))
+    else:
+        data = data[:len(data) - len(data) % 40]
+        for uid, user_id, status, timestamp, punch in _ATTENDANCE_40.iter_unpack(data):
+            user_id = user_id.split(b'\x00')[0].decode(errors='ignore')
+            append(Attendance(user_id, _decode_time(timestamp), status, punch, uid))
+    return attendance
+
+
+def _records_since(attendance, since):
+    """
+    Drop the records a device logged before its first record stamped at or after since.
+
+    The device log is in the order punches happened, so everything after that
+    record is new even if stamped earlier, as after the device clock was set back.
+    When no record reaches since, the log was cleared or the clock reset, and the
+    whole log is returned for the caller's duplicate check to sort out.
+    """
+    for index, record in enumerate(attendance):
+        if record.timestamp >= since:
+            return attendance[index:]
+    return attendance
+
+
+def _attendance_rows(attendance, format_timestamps):
+    """Yield (user_id, timestamp, punch_type, status) tuples for raw pyzk attendance records."""
+    # Bound to locals once; globals and builtins are slower to look up per record.
+    # isoformat is a C fast path, unlike strftime which parses its format per call
+    iso = datetime.isoformat
+    _str, _getattr, _isinstance = str, getattr, isinstance
+    for record in attendance:
+        user_id = record.user_id
+        timestamp = record.timestamp
+        yield (
+            user_id if _isinstance(user_id, _str) else _str(user_id),
+            iso(timestamp, sep=' ', timespec='seconds') if format_timestamps else timestamp,
+            _getattr(record, 'punch', 0),
+            _getattr(record, 'status', 1)
+        )
 
 
 class ZKService:
     def __init__(self):
+        # One open connection per 'ip:port'; ZK devices handle one command at a time,
+        # so each is used by a single thread at once under its device lock
         self.connections = {}
+        self._device_locks = {}
+        # {'ip:port': (monotonic time read, get_device_info dict)}
+        self._info_cache = {}
+        # {'ip:port': monotonic time of the last checkout}
+        self._last_used = {}
+        # {host name: (monotonic time resolved, address)}
+        self._dns_cache = {}
+        # Guards changes to connections, _device_locks and _info_cache
+        self._pool_lock = threading.Lock()
+
+        # Pings idle connections so dead ones are dropped before a caller waits on them
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat_thread = None
 
     def test_connection(self, ip, port=4370, timeout=5):
         """Test connection to a ZK device."""
-        zk = ZK(ip, port=port, timeout=timeout)
-        conn = None
-
-        try:
-            conn = zk.connect()
-            conn.disable_device()
-
-            # Get device info
+        def test(conn):
+            # Read-only, so the device is left enabled; only the user count needs to be live
             users = conn.get_users()
-            firmware = conn.get_firmware_version()
-            serial = conn.get_serialnumber()
-
-            conn.enable_device()
+            info = self._static_info(f'{ip}:{port}', conn)
 
             return {
                 'success': True,
                 'user_count': len(users) if users else 0,
-                'firmware': firmware,
-                'serial': serial
+                'firmware': info['firmware'],
+                'serial': info['serial']
             }
+
+        try:
+            return self._call(ip, port, timeout, test)
         except socket.timeout:
             raise Exception('Connection timeout - device not reachable')
         except Exception as e:
             raise Exception(f'Connection failed: {str(e)}')
-        finally:
-            if conn:
-                try:
-                    conn.disconnect()
-                except:
-                    pass
 
     def connect(self, ip, port=4370, timeout=10):
         """Connect to a ZK device."""
         key = f'{ip}:{port}'
-        if key in self.connections:
-            return self.connections[key]
+        with self._device_lock(key):
+            conn = self.connections.get(key)
+            if conn is not None:
+                return conn
 
-        zk = ZK(ip, port=port, timeout=timeout)
-        try:
-            conn = zk.connect()
-            self.connections[key] = conn
+            try:
+                zk = ZK(self._resolve(ip), port=port, timeout=timeout)
+                conn = zk.connect()
+            except Exception as e:
+                # The name may point somewhere else now
+                self._dns_cache.pop(ip, None)
+                raise Exception(f'Failed to connect to device {ip}:{port}: {str(e)}')
+            _tune_socket(conn)
+
+            with self._pool_lock:
+                self.connections[key] = conn
+                if self._heartbeat_thread is None:
+                    self._heartbeat_stop.clear()
+                    self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+                    self._heartbeat_thread.start()
             return conn
-        except Exception as e:
-            raise Exception(f'Failed to connect to device {ip}:{port}: {str(e)}')
+
+    def _resolve(self, host):
+        """Get the IPv4 address of a device host name, looking it up at most once per DNS_CACHE_TTL."""
+        try:
+            socket.inet_aton(host)
+            return host  # Already an address
+        except OSError:
+            pass
+
+        cached = self._dns_cache.get(host)
+        if cached is not None and time.monotonic() - cached[0] < DNS_CACHE_TTL:
+            return cached[1]
+
+        address = socket.gethostbyname(host)
+        self._dns_cache[host] = (time.monotonic(), address)
+        return address
 
     def disconnect(self, ip, port=4370):
         """Disconnect from a ZK device."""
-        key = f'{ip}:{port}'
-        if key in self.connections:
-            try:
-                self.connections[key].disconnect()
-            except:
-                pass
-            del self.connections[key]
+        self._disconnect_key(f'{ip}:{port}')
 
     def disconnect_all(self):
         """Disconnect from all devices."""
-        for key in list(self.connections.keys()):
+        with self._pool_lock:
+            thread, self._heartbeat_thread = self._heartbeat_thread, None
+        if thread is not None:
+            self._heartbeat_stop.set()
+            thread.join()
+
+        with self._pool_lock:
+            keys = list(self.connections.keys())
+        for key in keys:
+            self._disconnect_key(key)
+
+    def _disconnect_key(self, key):
+        """Close and forget one connection once nothing is using it."""
+        with self._device_lock(key):
+            conn = self._forget(key)
+            if conn is not None:
+                try:
+                    conn.disconnect()
+                except _DEVICE_ERRORS as e:
+                    logger.warning('disconnect failed for %s: %s', key, e)
+                    # pyzk only closes the socket after a successful exit handshake
+                    _close_socket(conn)
+
+    def _forget(self, key):
+        """Remove a connection from the pool without closing it, returning it if there was one."""
+        with self._pool_lock:
+            # A dropped connection may mean a rebooted or reflashed device
+            self._info_cache.pop(key, None)
+            return self.connections.pop(key, None)
+
+    def _discard(self, key):
+        """Drop a broken connection from the pool and close its socket without the exit handshake."""
+        conn = self._forget(key)
+        if conn is not None:
+            _close_socket(conn)
+
+    def _static_info(self, key, conn):
+        """Get the device's firmware/serial/platform/mac, reading them at most once per DEVICE_INFO_TTL."""
+        cached = self._info_cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < DEVICE_INFO_TTL:
+            return cached[1]
+
+        # Not every pyzk version has these
+        get_platform = getattr(conn, 'get_platform', None)
+        get_device_name = getattr(conn, 'get_device_name', None)
+        get_mac = getattr(conn, 'get_mac', None)
+        info = {
+            'firmware': conn.get_firmware_version(),
+            'serial': conn.get_serialnumber(),
+            'platform': get_platform() if get_platform else None,
+            'device_name': get_device_name() if get_device_name else None,
+            'mac': get_mac() if get_mac else None
+        }
+        with self._pool_lock:
+            self._info_cache[key] = (time.monotonic(), info)
+        return info
+
+    def _device_lock(self, key):
+        """Get the lock giving one thread at a time the use of a device's connection."""
+        with self._pool_lock:
+            lock = self._device_locks.get(key)
+            if lock is None:
+                # Reentrant so _call can hold it across connect()
+                lock = self._device_locks[key] = threading.RLock()
+            return lock
+
+    def _checkout(self, key, timeout):
+        """Take exclusive use of a device, waiting up to timeout seconds for another caller to finish."""
+        if not self._device_lock(key).acquire(timeout=timeout):
+            raise Exception(f'Device {key} is busy')
+        self._last_used[key] = time.monotonic()
+
+    def _checkin(self, key):
+        """Release a device taken with _checkout."""
+        self._device_lock(key).release()
+
+    def _heartbeat_loop(self):
+        """Periodically ping connections idle for a full interval, dropping the ones that do not answer."""
+        while not self._heartbeat_stop.wait(HEARTBEAT_INTERVAL):
+            with self._pool_lock:
+                keys = list(self.connections.keys())
+            for key in keys:
+                if time.monotonic() - self._last_used.get(key, 0) < HEARTBEAT_INTERVAL:
+                    continue
+                # Skip a device in use; it is evidently not idle
+                lock = self._device_lock(key)
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    self._ping(key)
+                except Exception as e:
+                    # A malformed reply leaves the link in an unknown state; drop it and
+                    # keep the thread alive for the other devices
+                    logger.warning('heartbeat failed for %s: %r', key, e)
+                    self._discard(key)
+                finally:
+                    lock.release()
+
+    def _ping(self, key):
+        """Send a cheap command over an idle connection, forgetting it if the device does not answer."""
+        conn = self.connections.get(key)
+        if conn is None:
+            return
+
+        sock = _device_socket(conn)
+        previous_timeout = sock.gettimeout() if sock is not None else None
+        try:
+            if sock is not None:
+                sock.settimeout(HEARTBEAT_TIMEOUT)
+            conn.get_time()
+        except _CONNECTION_ERRORS:
+            self._discard(key)
+            return
+        except ZKErrorResponse:
+            pass  # The device answered, even if with an error
+
+        if sock is not None:
+            sock.settimeout(previous_timeout)
+
+    def _call(self, ip, port, timeout, operation):
+        """
+        Run operation(conn) on the device's open connection, holding the device for the whole call.
+
+        timeout bounds both the wait for the device and each socket read of the call,
+        whichever call first opened the pooled connection.
+
+        A reused connection that fails with a network error has most likely
+        gone stale, so it is dropped and the operation retried once on a new one.
+        Operations must therefore be safe to run again after a network error:
+        one that destroys data on the device must not let such an error escape
+        once that command may have taken effect.
+        """
+        key = f'{ip}:{port}'
+        self._checkout(key, timeout)
+        try:
+            reused = key in self.connections
+            conn = self.connect(ip, port, timeout)
             try:
-                self.connections[key].disconnect()
-            except:
-                pass
-        self.connections.clear()
+                return self._run(key, conn, timeout, operation)
+            except _CONNECTION_ERRORS:
+                if not reused:
+                    raise
+
+            conn = self.connect(ip, port, timeout)
+            return self._run(key, conn, timeout, operation)
+        finally:
+            self._checkin(key)
 
-    def get_attendance(self, ip, port=4370, clear_after_fetch=False):
+    def _run(self, key, conn, timeout, operation):
+        """
+        Run operation(conn) with the caller's socket timeout; pyzk only sets one when connecting.
+
+        The connection is dropped on any failure but a clean refusal from the device,
+        since a transfer broken off part-way leaves its remaining replies on the socket.
+        """
+        try:
+            sock = _device_socket(conn)
+            if sock is not None:
+                sock.settimeout(timeout)
+            return operation(conn)
+        except BaseException as e:
+            if not (isinstance(e, ZKErrorResponse) and str(e) in _CLEAN_REFUSALS):
+                # Skip the exit handshake, which would only time out
+                self._discard(key)
+            raise
+
+    def get_attendance(self, ip, port=4370, clear_after_fetch=False, disable_while_reading=False, since=None):
         """
         Get attendance records from a ZK device.
 
+        Given since (a datetime), records logged before the device's first record
+        stamped at or after it are skipped; see _records_since.
+
         Returns list of attendance records:
         [
             {
@@ -92,54 +479,128 @@ class ZKService:
             ...
         ]
         """
-        zk = ZK(ip, port=port, timeout=30)
-        conn = None
+        return list(self.iter_attendance(ip, port, clear_after_fetch, disable_while_reading, since))
 
-        try:
-            conn = zk.connect()
-            conn.disable_device()
+    def iter_attendance(self, ip, port=4370, clear_after_fetch=False, disable_while_reading=False, since=None,
+                        format_timestamps=True):
+        """
+        Get attendance records from a ZK device as an iterator of get_attendance's dicts.
 
-            # Get attendance records
-            attendance = conn.get_attendance()
-
-            records = []
-            if attendance:
-                for record in attendance:
-                    records.append({
-                        'user_id': str(record.user_id),
-                        'timestamp': record.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                        'punch_type': record.punch if hasattr(record, 'punch') else 0,
-                        'status': record.status if hasattr(record, 'status') else 1
-                    })
+        The device is read (and released) before this returns, so errors are raised
+        here; records are then formatted one at a time as they are consumed.
+        With format_timestamps=False, timestamps are left as the device's datetimes
+        for callers that store or serialize them directly.
+        """
+        rows = self.iter_attendance_rows(
+            ip, port, clear_after_fetch, disable_while_reading, since, format_timestamps
+        )
+        return ({
+            'user_id': user_id,
+            'timestamp': timestamp,
+            'punch_type': punch_type,
+            'status': status
+        } for user_id, timestamp, punch_type, status in rows)
+
+    def iter_attendance_rows(self, ip, port=4370, clear_after_fetch=False, disable_while_reading=False,
+                             since=None, format_timestamps=True):
+        """
+        Like iter_attendance, but yielding (user_id, timestamp, punch_type, status) tuples.
 
-            # Optionally clear attendance after fetching
-            if clear_after_fetch and records:
-                conn.clear_attendance()
+        Cheaper than building a dict per record, for callers that unpack records anyway.
+        """
+        attendance = self._read_attendance(ip, port, clear_after_fetch, disable_while_reading, since)
+        return _attendance_rows(attendance, format_timestamps)
 
-            conn.enable_device()
+    def get_attendance_columnar(self, ip, port=4370, clear_after_fetch=False, disable_while_reading=False,
+                                since=None):
+        """
+        Get attendance records from a ZK device as parallel columns.
+
+        Much lighter than get_attendance for large device logs: one list or
+        byte array per field instead of one dict per record.
+
+        Returns:
+            {
+                'user_id': ['1', ...],
+                'timestamp': ['2024-01-15 09:30:00', ...],
+                'punch_type': array('B', [0, ...]),
+                'status': array('B', [1, ...])
+            }
+        """
+        attendance = self._read_attendance(ip, port, clear_after_fetch, disable_while_reading, since)
+
+        iso = datetime.isoformat
+        return {
+            'user_id': [
+                record.user_id if isinstance(record.user_id, str) else str(record.user_id)
+                for record in attendance
+            ],
+            'timestamp': [iso(record.timestamp, sep=' ', timespec='seconds') for record in attendance],
+            # Both are single bytes in the device's record format
+            'punch_type': array('B', [getattr(record, 'punch', 0) for record in attendance]),
+            'status': array('B', [getattr(record, 'status', 1) for record in attendance])
+        }
+
+    def _read_attendance(self, ip, port, clear_after_fetch, disable_while_reading, since=None):
+        """
+        Read the raw pyzk attendance records from a device, optionally clearing them after.
+
+        pyzk can only download the whole log, so records logged before since are
+        dropped here, before any per-record formatting or storage work is spent on them.
 
-            return records
+        The device keeps accepting punches during a plain read. It is disabled when
+        asked, or when clearing, so no punch lands between the read and the clear.
+        """
+        def read(conn):
+            # The whole log comes in one buffered transfer
+            attendance = _fetch_attendance(conn) or []
+            if since is not None:
+                attendance = _records_since(attendance, since)
+            return attendance
+
+        def read_and_clear(conn):
+            conn.disable_device()
+            try:
+                # Reading is safe for _call to repeat after a network error
+                attendance = _fetch_attendance(conn) or []
+            except BaseException:
+                try:
+                    conn.enable_device()
+                except _DEVICE_ERRORS:
+                    pass  # Report the original failure, not this one
+                raise
 
+            # From here the log may be gone from the device, so the records just read
+            # are returned even if the link drops, rather than retrying into an empty log
+            try:
+                if attendance:
+                    conn.clear_attendance()
+                conn.enable_device()
+            except _CONNECTION_ERRORS:
+                self._discard(f'{ip}:{port}')
+
+            if since is not None:
+                attendance = _records_since(attendance, since)
+            return attendance
+
+        def fetch(conn):
+            if clear_after_fetch:
+                return read_and_clear(conn)
+            if disable_while_reading:
+                with _device_disabled(conn):
+                    return read(conn)
+            return read(conn)
+
+        try:
+            return self._call(ip, port, 30, fetch)
         except socket.timeout:
             raise Exception('Connection timeout while fetching attendance')
         except Exception as e:
             raise Exception(f'Failed to get attendance: {str(e)}')
-        finally:
-            if conn:
-                try:
-                    conn.disconnect()
-                except:
-                    pass
 
     def get_users(self, ip, port=4370):
         """Get all users from a ZK device."""
-        zk = ZK(ip, port=port, timeout=30)
-        conn = None
-
-        try:
-            conn = zk.connect()
-            conn.disable_device()
-
+        def fetch(conn):
             users = conn.get_users()
 
             result = []
@@ -150,93 +611,97 @@ class ZKService:
                         'user_id': user.user_id,
                         'name': user.name,
                         'privilege': user.privilege,
-                        'card': user.card if hasattr(user, 'card') else None
+                        'card': getattr(user, 'card', None)
                     })
 
-            conn.enable_device()
-
             return result
 
+        try:
+            return self._call(ip, port, 30, fetch)
         except Exception as e:
             raise Exception(f'Failed to get users: {str(e)}')
-        finally:
-            if conn:
-                try:
-                    conn.disconnect()
-                except:
-                    pass
 
     def get_device_info(self, ip, port=4370):
         """Get device information."""
-        zk = ZK(ip, port=port, timeout=10)
-        conn = None
-
-        try:
-            conn = zk.connect()
-
-            info = {
-                'firmware': conn.get_firmware_version(),
-                'serial': conn.get_serialnumber(),
-                'platform': conn.get_platform() if hasattr(conn, 'get_platform') else None,
-                'device_name': conn.get_device_name() if hasattr(conn, 'get_device_name') else None,
-                'mac': conn.get_mac() if hasattr(conn, 'get_mac') else None
-            }
+        key = f'{ip}:{port}'
+        cached = self._info_cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < DEVICE_INFO_TTL:
+            return dict(cached[1])
 
-            return info
+        def fetch(conn):
+            return dict(self._static_info(key, conn))
 
+        try:
+            return self._call(ip, port, 10, fetch)
         except Exception as e:
             raise Exception(f'Failed to get device info: {str(e)}')
-        finally:
-            if conn:
-                try:
-                    conn.disconnect()
-                except:
-                    pass
 
     def set_device_time(self, ip, port=4370, new_time=None):
         """Set device time. If new_time is None, sets to current system time."""
-        zk = ZK(ip, port=port, timeout=10)
-        conn = None
-
-        try:
-            conn = zk.connect()
-            conn.disable_device()
-
-            if new_time is None:
-                new_time = datetime.now()
+        if new_time is None:
+            new_time = datetime.now()
 
-            conn.set_time(new_time)
-            conn.enable_device()
+        def set_time(conn):
+            with _device_disabled(conn):
+                conn.set_time(new_time)
 
+        try:
+            self._call(ip, port, 10, set_time)
             return {'success': True, 'time_set': new_time.strftime('%Y-%m-%d %H:%M:%S')}
-
         except Exception as e:
             raise Exception(f'Failed to set device time: {str(e)}')
-        finally:
-            if conn:
-                try:
-                    conn.disconnect()
-                except:
-                    pass
 
     def clear_attendance(self, ip, port=4370):
         """Clear all attendance records from device."""
-        zk = ZK(ip, port=port, timeout=30)
-        conn = None
+        def clear(conn):
+            with _device_disabled(conn):
+                conn.clear_attendance()
 
         try:
-            conn = zk.connect()
-            conn.disable_device()
-            conn.clear_attendance()
-            conn.enable_device()
-
+            self._call(ip, port, 30, clear)
             return {'success': True, 'message': 'Attendance records cleared'}
-
         except Exception as e:
             raise Exception(f'Failed to clear attendance: {str(e)}')
-        finally:
-            if conn:
-                try:
-                    conn.disconnect()
-                except:
-                    pass
+
+    def _for_each_device(self, fetch, devices, max_workers):
+        """
+        Run fetch(ip, port) for many devices concurrently.
+
+        Args:
+            fetch: bound method taking (ip, port)
+            devices: list of (ip, port) tuples
+            max_workers: maximum number of devices polled at once
+
+        Returns:
+            list in the same order as devices of {'success': True, 'data': ...},
+            or {'success': False, 'message': ...} for a device that failed
+        """
+        if not devices:
+            return []
+
+        def run(device):
+            try:
+                return {'success': True, 'data': fetch(*device)}
+            except Exception as e:
+                return {'success': False, 'message': str(e)}
+
+        # Each device has its own socket; the device locks keep one thread per socket
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(devices))) as executor:
+            return list(executor.map(run, devices))
+
+    def get_attendance_many(self, devices, clear_after_fetch=False, disable_while_reading=False,
+                            since=None, max_workers=MAX_DEVICE_WORKERS):
+        """Get attendance records from many devices concurrently. See _for_each_device."""
+        return self._for_each_device(
+            lambda ip, port: self.get_attendance(ip, port, clear_after_fetch, disable_while_reading, since),
+            devices,
+            max_workers
+        )
+
+    def get_users_many(self, devices, max_workers=MAX_DEVICE_WORKERS):
+        """Get all users from many devices concurrently. See _for_each_device."""
+        return self._for_each_device(self.get_users, devices, max_workers)
+
+    def get_device_info_many(self, devices, max_workers=MAX_DEVICE_WORKERS):
+        """Get device information from many devices concurrently. See _for_each_device."""
+        return self._for_each_device(self.get_device_info, devices, max_workers)